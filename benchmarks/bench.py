@@ -0,0 +1,220 @@
+"""
+Usage: python benchmarks/bench.py [--output FILE] [--compare FILE]
+                                  [--repeat N] [--threshold FRACTION]
+                                  [BENCHMARK ...]
+
+Run the cliutils benchmark suite, or the named benchmarks of it, and print
+the results as JSON (or write them to FILE).
+
+Each benchmark runs a fixed workload C{--repeat} times (5 by default) and
+keeps the best time, so results are comparable from one run to the next.
+With C{--compare}, results are also checked against an earlier run: any
+benchmark more than C{--threshold} (0.1 by default) slower is reported as a
+regression, and the exit status is non-zero.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+import cliutils
+from cliutils import persistence
+from cliutils.decorators import cliargs
+from cliutils.process import Process, sh
+from cliutils.session import Session
+
+BENCHMARKS = []
+
+def benchmark(unit, ops):
+    """
+    Register a function running a workload of C{ops} C{unit}s as a
+    benchmark. The function is called with a scratch directory, and may
+    return a setup function to be timed instead of itself.
+    """
+    def register(f):
+        BENCHMARKS.append((f.__name__, unit, ops, f))
+        return f
+    return register
+
+@benchmark("spawns", 200)
+def process_spawn(tmp):
+    for i in xrange(200):
+        Process(["true"]).retcode
+
+@benchmark("commands", 200)
+def session_commands(tmp):
+    session = Session()
+    for i in xrange(200):
+        session.true().retcode
+    session.close()
+
+@benchmark("MB", 256)
+def pipeline_throughput(tmp):
+    p = sh.head(["-c", str(256 * 1024 * 1024), "/dev/zero"]) | sh.cat() \
+        | sh.cat()
+    for chunk in p.iter_chunks():
+        pass
+
+@benchmark("lookups", 100000)
+def sh_dispatch(tmp):
+    for i in xrange(100000):
+        sh.echo
+
+@benchmark("writes", 1000)
+def config_setitem(tmp):
+    cfg = persistence.config("bench.cfg", tmp)
+    section = cfg['section']
+    for i in xrange(1000):
+        section['option%d' % i] = i
+
+@benchmark("writes", 20000)
+def db_write(tmp):
+    d = persistence.db("bench-write.db", tmp)
+    for i in xrange(20000):
+        d['key%d' % i] = {'value':i, 'items':range(10)}
+    d.close()
+
+@benchmark("writes", 20000)
+def db_write_cached(tmp):
+    d = persistence.db("bench-cached.db", tmp, cachesize=1000)
+    for i in xrange(20000):
+        d['key%d' % i] = {'value':i, 'items':range(10)}
+    d.close()
+
+@benchmark("writes", 20000)
+def db_write_sqlite(tmp):
+    d = persistence.db("bench-sqlite.db", tmp, backend="sqlite")
+    d.update_many(('key%d' % i, {'value':i, 'items':range(10)})
+                  for i in xrange(20000))
+    d.close()
+
+@benchmark("reads", 20000)
+def db_read(tmp):
+    d = persistence.db("bench-read.db", tmp)
+    for i in xrange(20000):
+        d['key%d' % i] = {'value':i, 'items':range(10)}
+    d.close()
+    def read():
+        d = persistence.db("bench-read.db", tmp)
+        for i in xrange(20000):
+            d['key%d' % i]
+        d.close()
+    return read
+
+@benchmark("arguments", 10000)
+def cliargs_parse(tmp):
+    @cliargs
+    def main(*args, **opts):
+        return args, opts
+    argv = ['bench']
+    for i in xrange(2500):
+        argv.extend(['file%d' % i, '--opt%d' % i, 'value', 'other%d' % i])
+    def parse():
+        saved = sys.argv[:]
+        sys.argv[:] = argv
+        try:
+            main()
+        finally:
+            sys.argv[:] = saved
+    return parse
+
+@benchmark("imports", 20)
+def import_cliutils(tmp):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(cliutils.__file__)))
+    saved = os.environ.get('PYTHONPATH')
+    os.environ['PYTHONPATH'] = root
+    try:
+        for i in xrange(20):
+            Process([sys.executable, "-c", "import cliutils"]).retcode
+    finally:
+        if saved is None:
+            del os.environ['PYTHONPATH']
+        else:
+            os.environ['PYTHONPATH'] = saved
+
+def run(names=None, repeat=5):
+    """
+    Run the benchmarks named in C{names}, or all of them.
+
+    @return: The results, keyed by benchmark name
+    @rtype: dict
+    """
+    results = {}
+    for name, unit, ops, f in BENCHMARKS:
+        if names and name not in names:
+            continue
+        times = []
+        for i in xrange(repeat):
+            tmp = tempfile.mkdtemp()
+            try:
+                start = time.time()
+                setup = f(tmp)
+                if setup is not None:
+                    start = time.time()
+                    setup()
+                times.append(time.time() - start)
+            finally:
+                shutil.rmtree(tmp)
+        best = min(times)
+        results[name] = {'seconds':best, 'ops':ops, 'unit':unit,
+                         'rate':ops / best}
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Print how C{results} compare with C{baseline}.
+
+    @return: The names of the benchmarks that regressed by more than
+    C{threshold}
+    @rtype: list
+    """
+    regressions = []
+    print >> sys.stderr, "%-22s %12s %12s %8s" % ("benchmark", "baseline",
+                                                  "current", "ratio")
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old = baseline[name]['seconds']
+        new = results[name]['seconds']
+        ratio = new / old
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print >> sys.stderr, "%-22s %11.4fs %11.4fs %7.2fx%s" % (
+            name, old, new, ratio, flag)
+    return regressions
+
+def main():
+    parser = OptionParser(usage=__doc__.strip())
+    parser.add_option("--output")
+    parser.add_option("--compare")
+    parser.add_option("--repeat", type="int", default=5)
+    parser.add_option("--threshold", type="float", default=0.1)
+    opts, names = parser.parse_args()
+    results = run(names, opts.repeat)
+    report = {'meta':{'python':platform.python_version(),
+                      'platform':platform.platform(),
+                      'cliutils':cliutils.__version__},
+              'results':results}
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if opts.output:
+        f = open(opts.output, 'w')
+        f.write(output + "\n")
+        f.close()
+    else:
+        print output
+    if opts.compare:
+        baseline = json.load(open(opts.compare))['results']
+        if compare(results, baseline, opts.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
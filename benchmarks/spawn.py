@@ -0,0 +1,63 @@
+"""
+Measure how the latency of spawning a process grows with the memory used by
+the parent, for the default C{fork}-based spawn and for C{posix_spawn}.
+
+Usage: python benchmarks/spawn.py [RSS_MB ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from cliutils.process import Process, _posixSpawn
+
+def touch(megabytes):
+    """
+    Grow the resident set of this process by C{megabytes}, touching every
+    page so that it is really mapped.
+    """
+    ballast = bytearray(megabytes * 1024 * 1024)
+    for i in xrange(0, len(ballast), 4096):
+        ballast[i] = 1
+    return ballast
+
+def spawn_latency(fastspawn, count=200):
+    """
+    Return the mean time, in seconds, taken to spawn and reap C{true}.
+    """
+    start = time.time()
+    for i in xrange(count):
+        Process(["true"], fastspawn=fastspawn).retcode
+    return (time.time() - start) / count
+
+def bench_spawn(sizes=(0, 256, 1024), count=200):
+    """
+    Measure spawn latency at each parent RSS in C{sizes} (megabytes).
+
+    @return: One dictionary per size, with keys C{rss_mb}, C{fork} and, if
+    the platform supports it, C{posix_spawn} (seconds per spawn)
+    @rtype: list
+    """
+    results = []
+    ballast = []
+    grown = 0
+    for size in sorted(sizes):
+        ballast.append(touch(size - grown))
+        grown = size
+        result = {'rss_mb':size, 'fork':spawn_latency(False, count)}
+        if _posixSpawn() is not None:
+            result['posix_spawn'] = spawn_latency(True, count)
+        results.append(result)
+    return results
+
+def main():
+    sizes = map(int, sys.argv[1:]) or (0, 256, 1024)
+    print "%8s %12s %12s" % ("RSS (MB)", "fork (ms)", "spawn (ms)")
+    for result in bench_spawn(sizes):
+        print "%8d %12.3f %12.3f" % (result['rss_mb'], result['fork'] * 1000,
+                                     result.get('posix_spawn', 0) * 1000)
+
+if __name__ == "__main__":
+    main()
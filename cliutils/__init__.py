@@ -139,6 +139,17 @@ The L{cliargs} decorator
     L{cliargs} is of course limited to very simple cases. More complex argument
     parsing will require the use of the C{getopt} or C{optparse} modules.
 
+Subcommands
+-----------
+    Programs made of several commands, in the manner of C{git} or C{svn}, may
+    be put together from functions with L{commands}, which dispatches on the
+    first argument and parses the rest with L{cliargs}::
+
+        main = commands({'init':'mytool.setup:init',
+                         'sync':'mytool.remote:sync'}, cache=".mytool-help")
+
+    Only the module of the command being run is imported.
+
 L{redirect}
 -----------
     L{redirect} is an almost trivially simple decorator factory. When
@@ -178,9 +189,50 @@ L{indir}
 """
 __version__="0.1.3"
 __all__=["sh", "Process", "cliargs", "redirect_decorator", "redirect", "indir",
-         "db", "config"]
-
-from process import sh, Process
-from decorators import cliargs, logged, log_decorator, redirect, indir
-from persistence import *
+         "db", "config", "commands"]
+
+import sys
+from types import ModuleType
+
+# The names above live in submodules that are only imported once one of them
+# is used, so that a script using, say, cliargs doesn't pay for loading
+# subprocess, shelve and ConfigParser as well.
+_exports = {
+    'sh':'process', 'Process':'process',
+    'cliargs':'decorators', 'logged':'decorators',
+    'log_decorator':'decorators',
+    'redirect':'decorators', 'indir':'decorators',
+    'storage_dir':'persistence', 'config':'persistence', 'db':'persistence',
+    'commands':'dispatch',
+}
+
+class _LazyModule(ModuleType):
+    """
+    The C{cliutils} package, importing submodules as their names are looked
+    up. Looking at its C{__dict__} (as C{dir} and C{doctest} do) imports
+    them all.
+    """
+    def __getattr__(self, name):
+        if name in _exports:
+            module = __import__(_exports[name], globals(), locals(), [name],
+                                -1)
+            value = getattr(module, name)
+        elif name in ('process', 'decorators', 'persistence', 'dispatch'):
+            value = __import__(name, globals(), locals(), [], -1)
+        else:
+            raise AttributeError(name)
+        setattr(self, name, value)
+        return value
+
+    @property
+    def __dict__(self):
+        for name in _exports:
+            getattr(self, name)
+        return ModuleType.__dict__['__dict__'].__get__(self)
+
+_lazy = _LazyModule(__name__, __doc__)
+ModuleType.__dict__['__dict__'].__get__(_lazy).update(globals())
+# Keep this module alive: its globals are cleared when it is collected.
+_lazy._module = sys.modules[__name__]
+sys.modules[__name__] = _lazy
 
@@ -0,0 +1,261 @@
+__all__ = ['AsyncProcess', 'ash']
+
+import os
+import weakref
+from cStringIO import StringIO
+from subprocess import PIPE
+
+import trollius as asyncio
+from trollius import From, Return
+
+from process import _normalize, AlreadyExecuted, InvalidCommand
+
+class AsyncProcess(object):
+    """
+    The asyncio counterpart of L{process.Process}, built on
+    C{create_subprocess_exec} so that any number of commands may run on one
+    event loop without blocking it or needing a thread per child.
+
+    Output and return code are exposed as coroutines, to be waited on from
+    within another coroutine:
+
+        >>> loop = asyncio.get_event_loop()
+        >>> p = AsyncProcess("echo 'one two three'") | AsyncProcess("wc -w")
+        >>> print loop.run_until_complete(p.stdout)
+        3
+
+    As with L{process.Process}, nothing is spawned until output or a return
+    code is requested, and the C{|} operator starts a whole pipeline at once.
+    """
+    _stdin = PIPE
+    _retcode = None
+    _process = None
+    _upstream = None
+    _downstream = None
+    _started = None
+    _finished = None
+
+    def __init__(self, cmd, stdin=None, loop=None):
+        """
+        @param cmd: A string or list containing the command to be executed.
+        @type cmd: str, list
+        @param stdin: An optional open file object representing input to the
+        process.
+        @type stdin: file
+        @param loop: The event loop to run on; defaults to the current one.
+        @type loop: C{asyncio.AbstractEventLoop}
+        @rtype: void
+        """
+        self._command = _normalize(cmd)
+        if stdin is not None:
+            self._stdin = stdin
+        self._loop = loop
+        self._stdoutstorage = StringIO()
+        self._stderrstorage = StringIO()
+        self._stderrtask = None
+
+    def __or__(self, proc):
+        """
+        Override default C{or} comparison so that the C{|} operator will work.
+        Don't call this directly.
+
+        @return: AsyncProcess with C{self}'s stdout as stdin pipe.
+        @rtype: L{AsyncProcess}
+        """
+        if self._started is not None or proc._started is not None:
+            raise AlreadyExecuted("You can't pipe processes after they've "
+                                  "been started.")
+        head = proc
+        while head._upstream is not None:
+            head = head._upstream
+        head._upstream = self
+        self._downstream = weakref.ref(head)
+        return proc
+
+    @property
+    def hasExecuted(self):
+        """
+        A boolean indicating whether or not the process has already run.
+
+        @rtype: bool
+        """
+        return self._retcode is not None
+
+    def _stages(self):
+        """
+        List the processes of the pipeline ending with this one, in order.
+        """
+        stages = [self]
+        while stages[0]._upstream is not None:
+            stages.insert(0, stages[0]._upstream)
+        return stages
+
+    def _tail(self):
+        """
+        Find the last process of the pipeline this one belongs to.
+        """
+        proc = self
+        while proc._downstream is not None and proc._downstream() is not None:
+            proc = proc._downstream()
+        return proc
+
+    def _start(self):
+        tail = self._tail()
+        if tail._started is None:
+            tail._started = asyncio.ensure_future(tail._spawn(),
+                                                  loop=tail._loop)
+        return tail._started
+
+    def _finish(self):
+        tail = self._tail()
+        if tail._finished is None:
+            tail._finished = asyncio.ensure_future(tail._run(),
+                                                   loop=tail._loop)
+        return tail._finished
+
+    @asyncio.coroutine
+    def _spawn(self):
+        """
+        Start every process of the pipeline ending with this one, connecting
+        them with OS pipes, and begin collecting their stderr.
+        """
+        stages = self._stages()
+        stdin = stages[0]._stdin
+        for stage in stages:
+            readfd = None
+            if stage is self:
+                stdout = PIPE
+            else:
+                readfd, stdout = os.pipe()
+            try:
+                try:
+                    stage._process = yield From(asyncio.create_subprocess_exec(
+                        *stage._command, stdin=stdin, stdout=stdout,
+                        stderr=PIPE, close_fds=True, loop=self._loop))
+                except OSError, e:
+                    for started in stages:
+                        if started._process is not None:
+                            try: started._process.kill()
+                            except OSError: pass
+                    if readfd is not None:
+                        os.close(readfd)
+                    raise InvalidCommand(" ".join(stage._command))
+            finally:
+                if stage is not stages[0]:
+                    os.close(stdin)
+                if readfd is not None:
+                    os.close(stdout)
+            if stage._process.stdin is not None:
+                stage._process.stdin.close()
+            stage._stderrtask = asyncio.ensure_future(
+                _collect(stage._process.stderr, stage._stderrstorage),
+                loop=self._loop)
+            stdin = readfd
+
+    @asyncio.coroutine
+    def _run(self):
+        yield From(self._start())
+        yield From(_collect(self._process.stdout, self._stdoutstorage))
+        stages = self._stages()
+        for stage in stages:
+            yield From(stage._stderrtask)
+        for stage in stages:
+            stage._retcode = yield From(stage._process.wait())
+
+    @asyncio.coroutine
+    def _after(self, getter):
+        yield From(self._finish())
+        raise Return(getter())
+
+    @asyncio.coroutine
+    def readline(self):
+        """
+        A coroutine returning the next line of output, without its trailing
+        newline, as soon as it has been produced; C{None} once the output is
+        exhausted. Lines read this way are not stored.
+
+            >>> loop = asyncio.get_event_loop()
+            >>> @asyncio.coroutine
+            ... def printlines(p):
+            ...     while True:
+            ...         line = yield From(p.readline())
+            ...         if line is None:
+            ...             break
+            ...         print line
+            >>> loop.run_until_complete(printlines(ash.seq("2")))
+            1
+            2
+
+        @rtype: coroutine
+        """
+        if self._tail() is not self:
+            raise AlreadyExecuted("Output is piped into another process.")
+        yield From(self._start())
+        line = yield From(self._process.stdout.readline())
+        if not line:
+            yield From(self._finish())
+            raise Return(None)
+        if line.endswith('\n'):
+            line = line[:-1]
+        raise Return(line)
+
+    @property
+    def stdout(self):
+        """
+        A coroutine returning the contents of stdout, executing the process
+        first if necessary.
+
+        @rtype: coroutine
+        """
+        return self._after(lambda: self._stdoutstorage.getvalue().strip())
+
+    @property
+    def stderr(self):
+        """
+        A coroutine returning the contents of stderr, executing the process
+        first if necessary.
+
+        @rtype: coroutine
+        """
+        return self._after(lambda: self._stderrstorage.getvalue().strip())
+
+    @property
+    def retcode(self):
+        """
+        A coroutine returning the exit code of the process, executing the
+        process first if necessary.
+
+        @rtype: coroutine
+        """
+        return self._after(lambda: self._retcode)
+
+
+@asyncio.coroutine
+def _collect(stream, storage, size=65536):
+    while True:
+        chunk = yield From(stream.read(size))
+        if not chunk:
+            break
+        storage.write(chunk)
+
+
+class _asyncshell(object):
+    """
+    Singleton class that creates AsyncProcess objects for commands passed.
+
+    Not meant to be instantiated; use the C{ash} instance.
+
+        >>> p = ash.wc("-w")
+        >>> p.__class__
+        <class 'cliutils.asyncprocess.AsyncProcess'>
+        >>> p._command
+        ['wc', '-w']
+
+    """
+    def __getattribute__(self, attr):
+        def inner(cmd=()):
+            command = [attr]
+            command.extend(_normalize(cmd))
+            return AsyncProcess(command)
+        return inner
+ash = _asyncshell()
@@ -0,0 +1,155 @@
+__all__ = ['ResultCache']
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+class ResultCache(object):
+    """
+    A cache of the results of commands, for commands that always produce the
+    same output given the same arguments, environment, working directory and
+    input (C{git rev-parse}, C{uname} or C{rpm -q}, say).
+
+    Pass one to L{process.Process} (or an C{sh} factory) as C{cache}, or set
+    it as C{Process.cache} to use it for every process. A command that has
+    been run before is then answered with a dictionary lookup instead of a
+    fork and exec:
+
+        >>> from cliutils.process import sh
+        >>> cache = ResultCache()
+        >>> sh.uname(cache=cache).stdout == sh.uname(cache=cache).stdout
+        True
+        >>> cache.stats['hits'], cache.stats['misses']
+        (1, 1)
+
+    Only results of pipelines whose every process exited with 0 are kept, and
+    only for processes whose input, if any, is given as a string. Entries are
+    held in memory, the least recently used being evicted once there are
+    C{maxsize} of them, and expire C{ttl} seconds after being stored. If a
+    C{filename} is given, entries are also kept on disk in a C{shelve}
+    under C{directory}, and so survive from one run to the next; the cache
+    should then be L{close}d once done with.
+    """
+    def __init__(self, maxsize=1024, ttl=None, filename=None, directory=""):
+        """
+        @param maxsize: The maximum number of results to hold in memory
+        @type maxsize: int
+        @param ttl: The number of seconds for which a result is valid, or
+        C{None} for ever
+        @type ttl: float
+        @param filename: The name of a database in which to keep results
+        @type filename: str
+        @param directory: The directory holding the database, passed through
+        L{persistence.storage_dir}
+        @type directory: str
+        @rtype: void
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if filename is not None:
+            import shelve
+            from persistence import storage_dir
+            self._db = shelve.open(os.path.join(storage_dir(directory),
+                                                filename))
+        self._stats = dict.fromkeys(('hits', 'misses', 'evictions', 'expired',
+                                     'disk_hits'), 0)
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha1(repr(key)).hexdigest()
+
+    def get(self, key):
+        """
+        Look up the result stored for C{key}.
+
+        @return: The result, or C{None} if there is no valid one
+        """
+        digest = self._digest(key)
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(digest, None)
+            ondisk = entry is None and self._db is not None
+            if ondisk:
+                entry = self._db.get(digest)
+            if entry is not None and entry[0] is not None \
+                    and entry[0] < time.time():
+                self._stats['expired'] += 1
+                if self._db is not None and digest in self._db:
+                    del self._db[digest]
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            if ondisk:
+                self._stats['disk_hits'] += 1
+            self._entries[digest] = entry
+            self._evict()
+            return entry[1]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        """
+        Store C{value} as the result for C{key}.
+        """
+        digest = self._digest(key)
+        expires = self.ttl is not None and time.time() + self.ttl or None
+        entry = (expires, value)
+        self._lock.acquire()
+        try:
+            self._entries.pop(digest, None)
+            self._entries[digest] = entry
+            self._evict()
+            if self._db is not None:
+                self._db[digest] = entry
+        finally:
+            self._lock.release()
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def clear(self):
+        """
+        Forget every result, in memory and on disk.
+        """
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.clear()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """
+        Save the results held on disk, if any, and close their database.
+        """
+        self._lock.acquire()
+        try:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        """
+        Counters of the lookups made so far: C{hits}, C{misses} (including
+        expired entries), C{evictions} from memory, C{expired} entries and
+        C{disk_hits}, the lookups answered from disk rather than memory.
+
+        @rtype: dict
+        """
+        return dict(self._stats)
@@ -28,6 +28,118 @@ class CLIargsError(Exception):
     "Arguments were not passed in correctly."
 
 
+# From the C{inspect} module, which is too slow to import for this alone.
+_CO_VARARGS = 0x04
+_CO_VARKEYWORDS = 0x08
+
+_booleans = {'1':True, 'yes':True, 'true':True, 'on':True,
+             '0':False, 'no':False, 'false':False, 'off':False}
+
+class _ArgPlan(object):
+    """
+    What a function accepts from the command line, worked out once from its
+    signature: the names of its positional parameters, the defaults of its
+    keyword parameters, and whether it takes any others.
+    """
+    def __init__(self, callable):
+        func = getattr(callable, 'im_func', callable)
+        code = getattr(func, 'func_code', None)
+        if code is None:
+            # Not a Python function; let it sort out its own arguments.
+            args, varargs, varkw, defaults = [], True, True, ()
+        else:
+            args = list(code.co_varnames[:code.co_argcount])
+            if getattr(callable, 'im_self', None) is not None:
+                args = args[1:]
+            varargs = code.co_flags & _CO_VARARGS
+            varkw = code.co_flags & _CO_VARKEYWORDS
+            defaults = func.func_defaults or ()
+        self.names = args
+        self.required = args[:len(args) - len(defaults)]
+        self.defaults = dict(zip(args[len(args) - len(defaults):], defaults))
+        self.varargs = bool(varargs)
+        self.varkw = bool(varkw)
+
+    def _name(self, option):
+        name = option.lstrip('-')
+        if name not in self.names and name.replace('-', '_') in self.names:
+            name = name.replace('-', '_')
+        if not (self.varkw or name in self.names):
+            raise CLIargsError("Unknown option: %s" % option)
+        return name
+
+    def _coerce(self, name, value):
+        default = self.defaults.get(name)
+        if isinstance(default, bool):
+            if value is True:
+                return value
+            try:
+                return _booleans[value.lower()]
+            except KeyError:
+                raise CLIargsError("%s takes a boolean, not %s" % (name,
+                                                                  value))
+        if value is not True and isinstance(default, (int, long, float)):
+            try:
+                return type(default)(value)
+            except ValueError:
+                raise CLIargsError("%s takes a number, not %s" % (name,
+                                                                 value))
+        return value
+
+    def parse(self, argv):
+        """
+        Turn C{argv} into positional and keyword arguments for the function,
+        in a single pass.
+
+        @return: The positional arguments, and the keyword arguments
+        @rtype: tuple
+        @raise CLIargsError: If the function doesn't accept them
+        """
+        args, opts = [], {}
+        i, count = 0, len(argv)
+        while i < count:
+            arg = argv[i]
+            i += 1
+            if arg == '--':
+                args.extend(argv[i:])
+                break
+            if not arg.startswith('-') or arg == '-':
+                args.append(arg)
+                continue
+            option, value = arg, None
+            if '=' in arg:
+                option, value = arg.split('=', 1)
+            name = self._name(option)
+            if value is None:
+                default = self.defaults.get(name)
+                if isinstance(default, bool):
+                    value = True
+                elif default is not None:
+                    if i == count:
+                        raise CLIargsError("%s needs a value" % option)
+                    value = argv[i]
+                    i += 1
+                elif i < count and not argv[i].startswith('-'):
+                    value = argv[i]
+                    i += 1
+                else:
+                    value = True
+            opts[name] = self._coerce(name, value)
+        if not self.varargs and len(args) > len(self.names):
+            raise CLIargsError("Too many arguments")
+        given = self.names[:len(args)]
+        missing = [name for name in self.required
+                   if name not in given and name not in opts]
+        if missing:
+            raise CLIargsError("Missing arguments: %s" % ", ".join(missing))
+        duplicated = [name for name in given if name in opts]
+        if duplicated:
+            raise CLIargsError("Given twice: %s" % ", ".join(duplicated))
+        for i, name in enumerate(given):
+            args[i] = self._coerce(name, args[i])
+        return args, opts
+
+
 @decorator
 def cliargs(callable):
     """
@@ -38,32 +150,33 @@ def cliargs(callable):
     sys.argv parsing itself). If something very simple is all that is required,
     this is the answer. Fancier arguments should use C{getopt} or C{optparse}.
 
-    If the wrong args/kwargs are passed in such that a TypeError is raised, the
-    docstring is printed, so that's an ideal place to put usage information.
+    Arguments are matched against the function's signature, inspected once
+    when it is decorated. C{--name value} and C{--name=value} set the keyword
+    argument C{name} (or C{name_with_underscores} for C{--name-with-dashes}),
+    converted to the type of its default if that is a number or a boolean, as
+    are positional arguments for parameters with such defaults; an option
+    whose default is a boolean is a flag, taking no value. Other
+    options not followed by a value are set to C{True}. Everything else, and
+    everything after C{--}, is passed as positional arguments.
+
+    If arguments are passed that the function doesn't accept, the docstring is
+    printed, so that's an ideal place to put usage information.
     """
+    plan = _ArgPlan(callable)
     def inner(*prog_args, **opts):
-        if not (prog_args or opts):
-            args = sys.argv[1:]
-            opts = {}
-            prog_args = []
-            while args:
-                if args[0].startswith('-'):
-                    if args[1].startswith('-'):
-                        opts[args[0].lstrip('-')] = True
-                        args = args[1:]
-                    else:
-                        opts[args[0].lstrip('-')] = args[1]
-                        args = args[2:]
-                else:
-                    prog_args.append(args[0])
-                    args = args[1:]
         try:
-            try: 
+            if not (prog_args or opts):
+                prog_args, opts = plan.parse(sys.argv[1:])
+            try:
                 return callable(*prog_args, **opts)
-            except TypeError, e: 
+            except TypeError, e:
+                if sys.exc_info()[2].tb_next is not None:
+                    # Raised within the function, not by calling it.
+                    raise
                 raise CLIargsError(e)
         except CLIargsError:
             print callable.__doc__
+    inner._cliargs = plan
     return inner
 
 
@@ -0,0 +1,188 @@
+__all__ = ['commands']
+
+import os
+import sys
+import json
+
+from decorators import cliargs
+
+def _load(target):
+    """
+    Import the function named by C{target}, a C{"module:function"} string.
+    """
+    module, name = target.split(':', 1)
+    __import__(module)
+    return getattr(sys.modules[module], name)
+
+def _source(target):
+    """
+    Find the file defining the module of C{target}, which must be imported.
+    """
+    filename = sys.modules[target.split(':', 1)[0]].__file__
+    if filename[-4:] in ('.pyc', '.pyo') and os.path.exists(filename[:-1]):
+        filename = filename[:-1]
+    return filename
+
+def _summary(func):
+    """
+    The first line of C{func}'s docstring.
+    """
+    doc = (func.__doc__ or '').strip()
+    return doc and doc.splitlines()[0].strip()
+
+def _mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+class _Commands(object):
+    """
+    A program made of subcommands. See L{commands}.
+    """
+    def __init__(self, table, prog=None, cache=None):
+        self.table = dict(table)
+        self.prog = prog
+        self.cache = cache and os.path.join(os.path.expanduser("~"), cache)
+        self._index = None
+
+    def _read(self):
+        try:
+            f = open(self.cache)
+            try:
+                return json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return {}
+
+    def _write(self, entries):
+        tmp = "%s.%d.tmp" % (self.cache, os.getpid())
+        try:
+            f = open(tmp, 'w')
+            try:
+                json.dump(entries, f)
+            finally:
+                f.close()
+            os.rename(tmp, self.cache)
+        except (IOError, OSError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def index(self):
+        """
+        Get the summary of each command: the first line of its docstring.
+        Commands are imported to find them only if they aren't in the cache,
+        or their module has changed since they were put there.
+
+        @return: The summaries, by command name
+        @rtype: dict
+        """
+        if self._index is None:
+            cached = self.cache and self._read() or {}
+            entries = {}
+            for name, target in self.table.items():
+                entry = cached.get(name)
+                if not (entry and entry['target'] == target and
+                        entry['mtime'] == _mtime(entry['file'])):
+                    summary = _summary(_load(target))
+                    filename = _source(target)
+                    entry = {'target':target, 'summary':summary,
+                             'file':filename, 'mtime':_mtime(filename)}
+                entries[name] = entry
+            if self.cache and entries != cached:
+                self._write(entries)
+            self._index = dict((name, entry['summary'])
+                               for name, entry in entries.items())
+        return self._index
+
+    def usage(self):
+        """
+        @return: The usage message, listing every command
+        @rtype: str
+        """
+        index = self.index()
+        lines = ["Usage: %s COMMAND [ARGS...]" % self._prog(), "",
+                 "Commands:"]
+        width = max([len(name) for name in index] or [0])
+        for name in sorted(index):
+            lines.append(("  %-*s  %s" % (width, name, index[name])).rstrip())
+        return "\n".join(lines)
+
+    def _prog(self):
+        return self.prog or os.path.basename(sys.argv and sys.argv[0] or "")
+
+    def __call__(self, argv=None):
+        """
+        Run the command named by the first of C{argv} (by default,
+        C{sys.argv[1:]}) with the rest.
+
+        @return: What the command returns, or 2 if none was named properly
+        """
+        if argv is None:
+            argv = sys.argv[1:]
+        if argv[:1] == ['help'] and argv[1:2]:
+            argv = [argv[1], '--help']
+        if not argv or argv[0] in ('-h', '--help', 'help'):
+            print self.usage()
+            if not argv:
+                return 2
+            return None
+        name = argv[0]
+        if name not in self.table:
+            print >> sys.stderr, "Unknown command: %s" % name
+            print >> sys.stderr, self.usage()
+            return 2
+        func = _load(self.table[name])
+        if argv[1:] in (['-h'], ['--help']):
+            print func.__doc__
+            return None
+        if not hasattr(func, '_cliargs'):
+            func = cliargs(func)
+        saved = sys.argv[:]
+        sys.argv[:] = ["%s %s" % (self._prog(), name)] + list(argv[1:])
+        try:
+            return func()
+        finally:
+            sys.argv[:] = saved
+
+
+def commands(table, prog=None, cache=None):
+    """
+    Make a program out of several functions, each run as a subcommand:
+    C{prog NAME ARGS...} runs the function registered as C{NAME}, with C{ARGS}
+    parsed by L{cliargs}. Functions are given as C{"module:function"} strings,
+    and only the module of the command being run is imported; the result may
+    be used as a setuptools entry point.
+
+        >>> tool = commands({'join':'posixpath:join',
+        ...                  'base':'posixpath:basename'}, prog='tool')
+        >>> tool(['join', 'spam', 'eggs'])
+        'spam/eggs'
+        >>> tool(['--help'])
+        Usage: tool COMMAND [ARGS...]
+        <BLANKLINE>
+        Commands:
+          base  Returns the final component of a pathname
+          join  Join two or more pathname components, inserting '/' as needed.
+
+    C{prog --help} (or C{prog help}) lists the commands, with the first line
+    of each one's docstring, and C{prog NAME --help} prints the docstring of
+    one. Listing the commands means importing them all, unless a C{cache} file
+    is given: the list is then kept there, and a command is imported again
+    only once the file defining it has changed.
+
+    @param table: The functions, as C{"module:function"} strings, by command
+    name
+    @type table: dict
+    @param prog: The name of the program, for usage messages; defaults to
+    that it was run as
+    @type prog: str
+    @param cache: The file to keep the list of commands in, relative to the
+    user's home directory unless absolute
+    @type cache: str
+    @return: A function running the command named in C{sys.argv}, or in the
+    list of arguments it is given
+    @rtype: callable
+    """
+    return _Commands(table, prog, cache)
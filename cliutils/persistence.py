@@ -1,6 +1,16 @@
 import os
+import time
 import shelve
+import cPickle
+import threading
+from UserDict import DictMixin
+from collections import OrderedDict
+from contextlib import contextmanager
 from ConfigParser import ConfigParser
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 __all__=["storage_dir", "config", "db"]
 
@@ -32,11 +42,27 @@ def storage_dir(directory=""):
 class _ConfigSection(object):
     """
     Wrapper that provides dictionary-like access
+
+        >>> import tempfile
+        >>> cfg = ConfigStorage(tempfile.mkstemp()[1])
+        >>> section = cfg['server']
+        >>> section['port'] = 8080
+        >>> section['hosts'] = "alpha, beta"
+        >>> 'port' in section, section.get('user', 'nobody')
+        (True, 'nobody')
+        >>> section.getint('port'), section.getlist('hosts')
+        (8080, ['alpha', 'beta'])
+
+    Values converted by the typed accessors are remembered, along with the
+    section, until it is next modified or its file is read again.
     """
-    def __init__(self, config, name, savefunc):
+    def __init__(self, config, name, savefunc, converted=None):
         self.name = name
         self.config = config
         self.savefunc = savefunc
+        if converted is None:
+            converted = {}
+        self._converted = converted
 
     def __getitem__(self, key):
         return self.config.get(self.name, key)
@@ -46,52 +72,339 @@ class _ConfigSection(object):
         if not self.config.has_section(self.name):
             self.config.add_section(self.name)
         self.config.set(self.name, key, value)
-        self.savefunc()
+        self._converted.clear()
+        self.savefunc(self.name, key, value)
+
+    def __contains__(self, option):
+        return self.config.has_option(self.name, option)
+
+    def __iter__(self):
+        return iter(self.keys())
 
     def __str__(self):
         return str(dict(self.items()))
 
     def items(self):
-        return zip(self.keys(), self.values())
+        return self.config.items(self.name)
 
     def keys(self):
         return self.config.options(self.name)
 
     def values(self):
-        return [self[key] for key in self.keys()]
+        return [value for key, value in self.items()]
 
     def has_option(self, option):
-        return option in self.keys()
+        return option in self
+
+    def get(self, key, default=None):
+        """
+        Get the value of option C{key}, or C{default} if there is no such
+        option.
+        """
+        if key not in self:
+            return default
+        return self[key]
+
+    def _convert(self, key, kind, convert, default):
+        if key not in self:
+            return default
+        try:
+            return self._converted[key, kind]
+        except KeyError:
+            value = self._converted[key, kind] = convert(self[key])
+            return value
+
+    def getint(self, key, default=None):
+        """
+        Get the value of option C{key} as an integer, or C{default} if there
+        is no such option.
+
+        @rtype: int
+        """
+        return self._convert(key, 'int', int, default)
+
+    def getfloat(self, key, default=None):
+        """
+        Get the value of option C{key} as a float, or C{default} if there is
+        no such option.
+
+        @rtype: float
+        """
+        return self._convert(key, 'float', float, default)
+
+    def getbool(self, key, default=None):
+        """
+        Get the value of option C{key} as a boolean, or C{default} if there is
+        no such option. As with C{ConfigParser.getboolean}, C{1}, C{yes},
+        C{true} and C{on} are true and C{0}, C{no}, C{false} and C{off} false;
+        anything else raises C{ValueError}.
+
+        @rtype: bool
+        """
+        def convert(value):
+            try:
+                return ConfigParser._boolean_states[value.lower()]
+            except KeyError:
+                raise ValueError("Not a boolean: %s" % value)
+        return self._convert(key, 'bool', convert, default)
+
+    def getlist(self, key, default=None, sep=","):
+        """
+        Get the value of option C{key} as a list of the non-empty strings
+        separated by C{sep}, with surrounding whitespace removed, or
+        C{default} if there is no such option.
+
+        @rtype: list
+        """
+        def convert(value):
+            return tuple(item.strip() for item in value.split(sep)
+                         if item.strip())
+        value = self._convert(key, ('list', sep), convert, default)
+        if isinstance(value, tuple):
+            return list(value)
+        return value
+
+
+class _ParsedFile(object):
+    """
+    The parsed contents of a config file, shared by every L{ConfigStorage} of
+    that file in this process, along with the C{stamp} of the file they were
+    read from and the values of each section C{converted} by its typed
+    accessors.
+    """
+    def __init__(self):
+        self.parser = ConfigParser()
+        self.stamp = None
+        self.lock = threading.RLock()
+        self.converted = {}
+
+_parsed = {}
+_parsedLock = threading.Lock()
+
+def _parsedFile(path):
+    """
+    Get the shared L{_ParsedFile} for C{path}.
+    """
+    path = os.path.abspath(path)
+    _parsedLock.acquire()
+    try:
+        if path not in _parsed:
+            _parsed[path] = _ParsedFile()
+        return _parsed[path]
+    finally:
+        _parsedLock.release()
+
+def _stamp(st):
+    """
+    Identify a version of a file from its C{os.stat} result: a file replaced
+    by another process has a new inode, and one changed in place a new mtime
+    or size.
+    """
+    return (st.st_ino, st.st_mtime, st.st_size)
+
+@contextmanager
+def _locked(filename):
+    """
+    Hold an exclusive advisory lock on C{filename}, creating it if necessary,
+    for the length of a C{with} block. Since files are saved by renaming a new
+    file over them, the lock is taken again if the file was replaced while we
+    waited for it.
+    """
+    while True:
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                current = os.stat(filename)
+            except OSError:
+                current = None
+            if current is not None and \
+                    _stamp(current)[0] == _stamp(os.fstat(fd))[0]:
+                yield
+                return
+        finally:
+            os.close(fd)
 
 
 class ConfigStorage(object):
+    """
+    A config file, saved whenever an option is set.
+
+    The file is replaced atomically: it is written out in full to a temporary
+    file next to it, which is then renamed over it, so that a crash can't
+    leave it truncated. If C{fsync} is set, the data and the rename are also
+    flushed to disk before L{save} returns.
+
+    Setting many options at once is best done in a L{batch}, which saves the
+    file once at the end rather than once per option.
+
+    Each file is parsed once per process: every L{ConfigStorage} of the same
+    path shares its contents, which are read again only when the file has
+    been changed on disk, as is checked each time a section is looked up.
+    Saving takes an advisory C{fcntl} lock on the file and first reads any
+    changes made by other processes, so that only the options set here are
+    overwritten.
+    """
 
     filename = ""
-    _config = ConfigParser()
+    fsync = False
+    _batch = 0
+    _dirty = False
 
-    def __init__(self, filename):
+    def __init__(self, filename, fsync=None):
+        """
+        @param filename: The path of the config file
+        @type filename: str
+        @param fsync: Whether to flush the file to disk on each save; defaults
+        to the C{fsync} class attribute
+        @type fsync: bool
+        @rtype: void
+        """
         self.filename = filename
+        if fsync is not None:
+            self.fsync = fsync
+        self._file = _parsedFile(filename)
+        self._config = self._file.parser
+        self._pending = []
         if os.path.exists(filename):
-            self.load()
+            self._refresh()
         else:
             self.save()
 
     def load(self):
-        self._config.read(self.filename)
+        """
+        Read the file again, whether or not it has changed.
+        """
+        self._file.lock.acquire()
+        try:
+            f = open(self.filename)
+            try:
+                for section in self._config.sections():
+                    self._config.remove_section(section)
+                for converted in self._file.converted.values():
+                    converted.clear()
+                self._config.readfp(f, self.filename)
+                self._file.stamp = _stamp(os.fstat(f.fileno()))
+            finally:
+                f.close()
+        finally:
+            self._file.lock.release()
+
+    def _refresh(self):
+        """
+        Read the file again if it has changed since it was last read or
+        written by this process.
+        """
+        try:
+            stamp = _stamp(os.stat(self.filename))
+        except OSError:
+            return
+        if stamp != self._file.stamp:
+            self.load()
+
+    def _set(self, section, key, value):
+        self._pending.append((section, key, value))
+        self.save()
 
     def save(self):
-        f = file(self.filename, 'w')
-        self._config.write(f)
-        f.close()
+        """
+        Write the config out to its file, or, within a L{batch}, once the
+        batch is over.
+        """
+        if self._batch:
+            self._dirty = True
+        else:
+            self._write()
+
+    def _write(self):
+        self._file.lock.acquire()
+        try:
+            if fcntl is None:
+                self._replace()
+            else:
+                with _locked(self.filename):
+                    self._refresh()
+                    for section, key, value in self._pending:
+                        if not self._config.has_section(section):
+                            self._config.add_section(section)
+                        self._config.set(section, key, value)
+                    self._replace()
+            self._pending = []
+            self._dirty = False
+        finally:
+            self._file.lock.release()
+
+    def _replace(self):
+        import tempfile
+        directory, name = os.path.split(os.path.abspath(self.filename))
+        try:
+            mode = os.stat(self.filename).st_mode & 07777
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0666 & ~umask
+        fd, tmp = tempfile.mkstemp(prefix="." + name, suffix=".tmp",
+                                   dir=directory)
+        try:
+            f = os.fdopen(fd, 'w')
+            try:
+                self._config.write(f)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                os.chmod(tmp, mode)
+                if os.name == 'nt' and os.path.exists(self.filename):
+                    os.remove(self.filename)
+                os.rename(tmp, self.filename)
+                self._file.stamp = _stamp(os.fstat(f.fileno()))
+            finally:
+                f.close()
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        if self.fsync and hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @contextmanager
+    def batch(self):
+        """
+        Defer saving until the end of a C{with} block, so that any number of
+        options may be set for the cost of writing the file once:
+
+            >>> import tempfile
+            >>> cfg = ConfigStorage(tempfile.mkstemp()[1])
+            >>> with cfg.batch():
+            ...     for i in range(1000):
+            ...         cfg['section']['option%d' % i] = i
+
+        Batches may be nested; the file is saved when the outermost one ends,
+        whether or not it ends with an exception.
+        """
+        self._batch += 1
+        try:
+            yield self
+        finally:
+            self._batch -= 1
+            if not self._batch and self._dirty:
+                self._write()
 
     def __getitem__(self, item):
-        return _ConfigSection(self._config, item, self.save)
+        self._refresh()
+        return _ConfigSection(self._config, item, self._set,
+                              self._file.converted.setdefault(item, {}))
 
     def keys(self):
+        self._refresh()
         return self._config.sections()
     sections = keys
 
     def has_section(self, section):
+        self._refresh()
         return self._config.has_section(section)
 
 
@@ -109,14 +422,553 @@ def config(filename, directory=""):
     return config
 
 
-def db(filename, directory=""):
+def _serializer(name):
+    """
+    Find the C{dumps} and C{loads} functions of the serializer called
+    C{name}, importing it only then.
+
+    @return: The pair of functions, or C{None} for an unknown C{name}
+    @rtype: tuple
+    """
+    if name == 'pickle':
+        return (lambda value: cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL),
+                cPickle.loads)
+    elif name == 'marshal':
+        import marshal
+        return marshal.dumps, marshal.loads
+    elif name == 'json':
+        import json
+        return json.dumps, json.loads
+    return None
+
+def _lzma():
+    """
+    Find an C{lzma} module: Python 2 has none of its own, but the
+    C{backports.lzma} package provides one.
+    """
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            return None
+    return lzma
+
+class Codec(object):
+    """
+    Turns the values of a L{db} into the strings stored for them, and back.
+
+    Values are serialized with C{pickle} (at its highest protocol), with
+    C{marshal} or C{json} (faster, but for fewer types), or with a custom
+    pair of C{dumps} and C{loads} functions. Those at least C{threshold} bytes
+    long may also be compressed, with C{zlib}, C{bz2} or (where a module for
+    it is installed) C{lzma}, if that makes them smaller:
+
+        >>> import marshal
+        >>> codec = Codec("marshal", compress="zlib")
+        >>> data = codec.dumps(range(1000))
+        >>> len(data) < len(marshal.dumps(range(1000)))
+        True
+        >>> codec.loads(data) == range(1000)
+        True
+
+    Each stored string starts with a byte telling how it was compressed, so it
+    can be read back whatever C{compress} is set to.
+    """
+    _raw = '-'
+    _flags = {'zlib':'z', 'bz2':'b', 'lzma':'x'}
+
+    def __init__(self, serializer="pickle", compress=None, threshold=1024):
+        """
+        @param serializer: C{"pickle"}, C{"marshal"}, C{"json"}, or a tuple of
+        C{dumps} and C{loads} functions
+        @type serializer: str, tuple
+        @param compress: C{"zlib"}, C{"bz2"}, C{"lzma"}, or C{None} to store
+        values uncompressed
+        @type compress: str
+        @param threshold: The size in bytes from which values are compressed
+        @type threshold: int
+        @rtype: void
+        """
+        import bz2, zlib
+        if isinstance(serializer, basestring):
+            name, serializer = serializer, _serializer(serializer)
+            if serializer is None:
+                raise ValueError("Unknown serializer: %s" % name)
+        self._dumps, self._loads = serializer
+        self._compressors = {'z':zlib, 'b':bz2}
+        if _lzma() is not None:
+            self._compressors['x'] = _lzma()
+        self._flag = None
+        if compress is not None:
+            self._flag = self._flags.get(compress)
+            if self._flag not in self._compressors:
+                raise ValueError("Unavailable compression: %s" % compress)
+        self.threshold = threshold
+        self._stats = dict.fromkeys(('values', 'bytes', 'stored',
+                                     'compressed'), 0)
+
+    def dumps(self, value):
+        """
+        @return: The string to store for C{value}
+        @rtype: str
+        """
+        data = self._dumps(value)
+        stored = self._raw + data
+        if self._flag is not None and len(data) >= self.threshold:
+            compressed = self._compressors[self._flag].compress(data)
+            if len(compressed) < len(data):
+                stored = self._flag + compressed
+                self._stats['compressed'] += 1
+        self._stats['values'] += 1
+        self._stats['bytes'] += len(data)
+        self._stats['stored'] += len(stored)
+        return stored
+
+    def loads(self, stored):
+        """
+        @return: The value C{stored} was made from
+        """
+        flag, data = stored[0], stored[1:]
+        if flag != self._raw:
+            data = self._compressors[flag].decompress(data)
+        return self._loads(data)
+
+    @property
+    def stats(self):
+        """
+        Counters of the values stored so far: how many (C{values}), how many
+        of them were C{compressed}, and their total size in C{bytes} when
+        serialized and once C{stored}.
+
+        @rtype: dict
+        """
+        return dict(self._stats)
+
+
+class SizedShelf(shelve.DbfilenameShelf):
+    """
+    The C{shelve.Shelf} returned by L{db}, which can report the size of its
+    entries.
+    """
+    def sizes(self):
+        """
+        Get the size of each entry as stored, to find the largest ones.
+
+        @return: The sizes in bytes, by key
+        @rtype: dict
+        """
+        return dict((key, len(self.dict[key])) for key in self.dict.keys())
+
+
+class CodecShelf(SizedShelf):
+    """
+    A C{shelve.Shelf} storing its values with a L{Codec} rather than pickling
+    them.
+    """
+    def __init__(self, filename, codec, writeback=False):
+        import anydbm
+        shelve.Shelf.__init__(self, anydbm.open(filename, 'c'),
+                              writeback=writeback)
+        self.codec = codec
+
+    def __getitem__(self, key):
+        try:
+            value = self.cache[key]
+        except KeyError:
+            value = self.codec.loads(self.dict[key])
+            if self.writeback:
+                self.cache[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if self.writeback:
+            self.cache[key] = value
+        self.dict[key] = self.codec.dumps(value)
+
+
+_immutable = (basestring, int, long, float, bool, complex, type(None))
+
+class CachedDB(DictMixin):
+    """
+    A persistent dictionary that keeps at most C{cachesize} of its entries in
+    memory, writing them back to the underlying C{store} only when they have
+    been modified: when they are evicted as the least recently used, when the
+    cache is L{flush}ed, and every C{flushinterval} seconds, as checked when
+    entries are set.
+
+    It should be closed once done with, as a C{shelve.Shelf} should;
+    otherwise, modified entries are only written back when it is collected.
+
+    As with C{shelve}'s C{writeback}, values fetched from it may be modified
+    in place: a mutable value is checked for changes before being evicted or
+    flushed, by comparing its pickle with that of the value as it was read.
+    Values that are set are always written.
+    """
+    def __init__(self, store, cachesize=1000, flushinterval=None):
+        """
+        @param store: The dictionary-like object to cache, such as a
+        C{shelve.Shelf}; it should have C{sync} and C{close} methods
+        @param cachesize: The maximum number of entries to hold in memory
+        @type cachesize: int
+        @param flushinterval: The number of seconds after which modified
+        entries are written back, or C{None} to wait for a flush
+        @type flushinterval: float
+        @rtype: void
+        """
+        self.store = store
+        self.cachesize = cachesize
+        self.flushinterval = flushinterval
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._digests = {}
+        self._flushed = time.time()
+        self._stats = dict.fromkeys(('hits', 'misses', 'evictions', 'writes',
+                                     'flushes'), 0)
+
+    @staticmethod
+    def _digest(value):
+        import hashlib
+        return hashlib.sha1(cPickle.dumps(value, 2)).digest()
+
+    def _modified(self, key):
+        if key in self._dirty:
+            return True
+        return key in self._digests and \
+            self._digests[key] != self._digest(self._cache[key])
+
+    def _remember(self, key, value):
+        self._cache[key] = value
+        if not isinstance(value, _immutable):
+            self._digests[key] = self._digest(value)
+        while len(self._cache) > self.cachesize:
+            oldest = iter(self._cache).next()
+            self._writeback(oldest)
+            del self._cache[oldest]
+            self._digests.pop(oldest, None)
+            self._stats['evictions'] += 1
+
+    def _writeback(self, key):
+        if self._modified(key):
+            value = self._cache[key]
+            self.store[key] = value
+            self._dirty.discard(key)
+            if key in self._digests:
+                self._digests[key] = self._digest(value)
+            self._stats['writes'] += 1
+
+    def __getitem__(self, key):
+        try:
+            value = self._cache.pop(key)
+        except KeyError:
+            value = self.store[key]
+            self._stats['misses'] += 1
+            self._remember(key, value)
+        else:
+            self._stats['hits'] += 1
+            self._cache[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._cache.pop(key, None)
+        self._digests.pop(key, None)
+        self._dirty.add(key)
+        self._remember(key, value)
+        if self.flushinterval is not None and \
+                time.time() - self._flushed >= self.flushinterval:
+            self.flush()
+
+    def __delitem__(self, key):
+        if key in self._cache:
+            del self._cache[key]
+            self._digests.pop(key, None)
+            self._dirty.discard(key)
+            if key in self.store:
+                del self.store[key]
+        else:
+            del self.store[key]
+
+    def __contains__(self, key):
+        return key in self._cache or key in self.store
+
+    def keys(self):
+        return list(set(self.store.keys()) | set(self._cache))
+
+    def flush(self):
+        """
+        Write every modified entry back to the store.
+        """
+        for key in self._cache:
+            self._writeback(key)
+        self._flushed = time.time()
+        self._stats['flushes'] += 1
+
+    def sync(self):
+        """
+        Flush the cache, then the store.
+        """
+        self.flush()
+        self.store.sync()
+
+    def sizes(self):
+        """
+        Write modified entries back, then get the size of each entry as
+        stored by the underlying store.
+
+        @return: The sizes in bytes, by key
+        @rtype: dict
+        """
+        self.flush()
+        return self.store.sizes()
+
+    def close(self):
+        if self.store is None:
+            return
+        try:
+            self.sync()
+            self.store.close()
+        finally:
+            self.store = None
+            self._cache.clear()
+            self._digests.clear()
+
+    def __del__(self):
+        # As with shelve.Shelf, modified entries are written back when the
+        # dictionary is collected without having been closed.
+        if not hasattr(self, '_cache'):
+            return
+        self.close()
+
+    @property
+    def stats(self):
+        """
+        Counters of the cache's use so far: C{hits} and C{misses} of lookups,
+        C{evictions} of least recently used entries, C{writes} of modified
+        entries to the store, and C{flushes}.
+
+        @rtype: dict
+        """
+        return dict(self._stats)
+
+
+class SQLiteDB(DictMixin):
+    """
+    A persistent dictionary of pickled values in an SQLite database, in WAL
+    mode: any number of processes may read it while one of them writes.
+
+    Each assignment is a transaction of its own; L{update_many} sets any
+    number of entries in one, and L{get_many} fetches many entries in a few
+    queries. Iterating over it streams keys, values or items from the
+    database rather than loading them all first.
+
+    Unlike the default L{db}, values aren't cached: one that is modified in
+    place must be set again to be saved.
+
+    Values are stored with a L{Codec}; by default, pickled.
+    """
+    _batch = 500
+
+    def __init__(self, filename, timeout=30.0, codec=None):
+        """
+        @param filename: The path of the database file
+        @type filename: str
+        @param timeout: The number of seconds to wait for another process to
+        finish writing
+        @type timeout: float
+        @param codec: The codec to store values with
+        @type codec: L{Codec}
+        @rtype: void
+        """
+        import sqlite3
+        self.filename = filename
+        self.codec = codec or Codec()
+        self._conn = sqlite3.connect(filename, timeout=timeout,
+                                     isolation_level=None)
+        self._conn.text_factory = str
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries "
+                           "(key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+
+    def _dumps(self, value):
+        # sqlite3.Binary is buffer; the module is only imported by __init__.
+        return buffer(self.codec.dumps(value))
+
+    def _loads(self, data):
+        return self.codec.loads(str(data))
+
+    def __getitem__(self, key):
+        row = self._conn.execute("SELECT value FROM entries WHERE key = ?",
+                                 (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._loads(row[0])
+
+    def __setitem__(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?)",
+                           (key, self._dumps(value)))
+
+    def __delitem__(self, key):
+        if not self._conn.execute("DELETE FROM entries WHERE key = ?",
+                                  (key,)).rowcount:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._conn.execute("SELECT 1 FROM entries WHERE key = ?",
+                                  (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def iterkeys(self):
+        for row in self._conn.execute("SELECT key FROM entries"):
+            yield row[0]
+
+    def itervalues(self):
+        for row in self._conn.execute("SELECT value FROM entries"):
+            yield self._loads(row[0])
+
+    def iteritems(self):
+        for key, value in self._conn.execute("SELECT key, value FROM entries"):
+            yield key, self._loads(value)
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def get_many(self, keys):
+        """
+        Fetch the entries for C{keys}.
+
+        @return: The values of those of C{keys} that are present, by key
+        @rtype: dict
+        """
+        keys = list(keys)
+        found = {}
+        for start in xrange(0, len(keys), self._batch):
+            chunk = keys[start:start + self._batch]
+            rows = self._conn.execute(
+                "SELECT key, value FROM entries WHERE key IN (%s)" %
+                ", ".join("?" * len(chunk)), chunk)
+            for key, value in rows:
+                found[key] = self._loads(value)
+        return found
+
+    def update_many(self, items):
+        """
+        Set every entry of C{items}, a dictionary or an iterable of key and
+        value pairs, in a single transaction.
+        """
+        if hasattr(items, 'iteritems'):
+            items = items.iteritems()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?)",
+                ((key, self._dumps(value)) for key, value in items))
+        except:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def clear(self):
+        self._conn.execute("DELETE FROM entries")
+
+    def sizes(self):
+        """
+        Get the size of each entry as stored, to find the largest ones.
+
+        @return: The sizes in bytes, by key
+        @rtype: dict
+        """
+        return dict(self._conn.execute(
+            "SELECT key, length(value) FROM entries"))
+
+    def sync(self):
+        """
+        Entries are saved as soon as they are set, so there is nothing to do.
+        """
+
+    def close(self):
+        self._conn.close()
+
+
+def db(filename, directory="", cachesize=None, flushinterval=None,
+       backend="shelve", codec=None, compress=None, threshold=None):
     """
     Create or load a pickled dictionary from C{filename} in optional
     C{directory}.
 
     C{directory} will be passed through L{storage_dir}, so it may be a path
     relative to the user's home directory.
+
+    By default, every entry read or set is kept in memory until the
+    dictionary is closed, and all of them are written back then. Given a
+    C{cachesize}, a L{CachedDB} holding at most that many entries, and writing
+    back only those that were modified, is returned instead:
+
+        >>> import tempfile
+        >>> d = db("example.db", tempfile.mkdtemp(), cachesize=2)
+        >>> for i in range(3):
+        ...     d[str(i)] = [i]
+        >>> d['0'].append(10)
+        >>> d.sync()
+        >>> d['0'], d.stats['evictions'], d.stats['writes']
+        ([0, 10], 2, 4)
+
+    With C{backend="sqlite"}, entries are kept in an L{SQLiteDB} instead of a
+    C{shelve}, which several processes may use at once. It too may be given a
+    C{cachesize}; without one, values aren't cached at all.
+
+    Values are pickled, unless a C{codec} is given; and may be compressed
+    once they reach C{threshold} bytes. See L{Codec}. Either of these makes a
+    C{shelve} file unreadable by C{shelve} itself, or by a L{db} opened
+    without them.
+
+    @param cachesize: The number of entries to hold in memory, or C{None} for
+    all of them
+    @type cachesize: int
+    @param flushinterval: With C{cachesize}, the number of seconds after which
+    modified entries are written back
+    @type flushinterval: float
+    @param backend: C{"shelve"} or C{"sqlite"}
+    @type backend: str
+    @param codec: How to serialize values: C{"pickle"}, C{"marshal"},
+    C{"json"}, a tuple of C{dumps} and C{loads} functions, or a L{Codec}
+    @type codec: str, tuple, L{Codec}
+    @param compress: How to compress values: C{"zlib"}, C{"bz2"} or C{"lzma"}
+    @type compress: str
+    @param threshold: With C{compress}, the size from which values are
+    compressed; 1024 bytes by default
+    @type threshold: int
     """
+    if backend not in ("shelve", "sqlite"):
+        raise ValueError("Unknown db backend: %s" % backend)
+    if isinstance(codec, Codec):
+        if compress is not None or threshold is not None:
+            raise ValueError("compress and threshold can't be given with a "
+                             "Codec; set them on the Codec instead")
+    elif threshold is not None and compress is None:
+        raise ValueError("threshold can't be given without compress")
+    elif codec is not None or compress is not None:
+        codec = Codec(codec or "pickle", compress,
+                      1024 if threshold is None else threshold)
     directory = storage_dir(directory)
-    return shelve.open(os.path.join(directory, filename), writeback=True)
+    path = os.path.join(directory, filename)
+    if backend == "sqlite":
+        store = SQLiteDB(path, codec=codec)
+        if cachesize is None:
+            return store
+    elif codec is not None:
+        store = CodecShelf(path, codec, writeback=cachesize is None)
+        if cachesize is None:
+            return store
+    elif cachesize is None:
+        return SizedShelf(path, writeback=True)
+    else:
+        store = SizedShelf(path)
+    return CachedDB(store, cachesize, flushinterval)
 
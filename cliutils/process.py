@@ -1,14 +1,33 @@
-__all__ = ['Process', 'sh', 'AlreadyExecuted', 'InvalidCommand']
+__all__ = ['Process', 'sh', 'run_many', 'as_completed', 'AlreadyExecuted',
+           'InvalidCommand', 'Timeout', 'add_hook', 'remove_hook', 'pyfilter']
 
 import os
+import mmap
+import time
+import errno
 import shlex
-from cStringIO import StringIO
+import select
+import Queue
+import weakref
+import signal
+import hashlib
+import tempfile
+import traceback
+import threading
 from subprocess import Popen, PIPE
 
 class AlreadyExecuted(Exception):
     """A command that doesn't exist has been called."""
 class InvalidCommand(Exception):
     """A command that doesn't exist has been called."""
+class Timeout(Exception):
+    """
+    A process or pipeline didn't finish within its timeout, and was killed.
+    Whatever output it produced before then is available as C{stdout} and
+    C{stderr}.
+    """
+    stdout = ''
+    stderr = ''
 
 def _normalize(cmd):
     """
@@ -24,6 +43,643 @@ def _normalize(cmd):
         cmd = shlex.split(cmd)
     return cmd
 
+def _which(name, path=None):
+    """
+    Find the executable that running C{name} would execute.
+
+    @param name: The name of a command, or a path to an executable
+    @type name: str
+    @param path: The directories to search, separated by C{os.pathsep};
+    defaults to C{os.defpath}
+    @type path: str
+    @return: The absolute path to the executable, or C{None} if there is
+    none
+    @rtype: str
+    """
+    if os.sep in name:
+        candidates = [name]
+    else:
+        candidates = [os.path.join(d or os.curdir, name) for d in
+                      (path or os.defpath).split(os.pathsep)]
+    for candidate in candidates:
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            # Absolute, so that it still names the same file after a chdir.
+            return os.path.abspath(candidate)
+    return None
+
+def _chunks(data):
+    """
+    Turn input for a process into an iterator of byte strings.
+
+    @param data: A string, or an iterable or generator of strings
+    @type data: str, unicode, iterable
+    @rtype: iterator
+    """
+    if isinstance(data, basestring):
+        data = [data]
+    for chunk in data:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+        yield chunk
+
+def _remaining(deadline):
+    """
+    The number of seconds left until C{deadline}, or C{None} if there is none.
+
+    @raise Timeout: If the deadline has passed
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise Timeout()
+    return remaining
+
+def _wait(proc, block=True):
+    """
+    Reap C{proc}, a C{Popen}, L{_SpawnedProcess} or L{_ThreadStage}, as its
+    C{wait} or C{poll} method would, but with C{wait4} where available so that
+    the resource usage of a child process can be kept as C{proc.rusage}. The
+    time it was reaped is kept as C{proc.reaped}.
+
+    @param block: Whether to wait for the process to exit
+    @type block: bool
+    @return: The exit code, or C{None} if the process is still running
+    @rtype: int
+    """
+    if proc.returncode is None:
+        if not hasattr(os, 'wait4') or isinstance(proc, _ThreadStage):
+            block and proc.wait() or proc.poll()
+        else:
+            try:
+                pid, status, rusage = os.wait4(proc.pid,
+                                               not block and os.WNOHANG or 0)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    return None
+                if e.errno != errno.ECHILD:
+                    raise
+                # Reaped behind our back; let the object sort itself out.
+                return block and proc.wait() or proc.poll()
+            if pid:
+                proc.rusage = rusage
+                proc._handle_exitstatus(status)
+        if proc.returncode is not None:
+            proc.reaped = time.time()
+    return proc.returncode
+
+def _reap(procs, deadline=None):
+    """
+    Wait for every one of C{procs} to exit.
+
+    @raise Timeout: If they haven't all exited by C{deadline}
+    """
+    if deadline is None:
+        for proc in procs:
+            while _wait(proc) is None:
+                pass
+        return
+    delay = 0.0005
+    while [proc for proc in procs if _wait(proc, False) is None]:
+        time.sleep(min(delay, _remaining(deadline)))
+        delay = min(delay * 2, 0.05)
+
+# Held while pipes for a child are made and marked close-on-exec, until the
+# child has been started. Spawning from several threads at once, a child
+# would otherwise inherit pipes another thread has yet to mark, and whoever
+# reads from one then waits for that child to exit before seeing EOF.
+_spawnLock = threading.Lock()
+
+def _cloexec(*files):
+    """
+    Keep C{files} (descriptors, or file objects; None is skipped) from being
+    inherited by processes started later.
+    """
+    import fcntl
+    for fd in files:
+        if fd is not None:
+            if not isinstance(fd, int):
+                fd = fd.fileno()
+            fcntl.fcntl(fd, fcntl.F_SETFD,
+                        fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+def _popen(*args, **kwargs):
+    """
+    C{Popen}, leaving none of our ends of the child's pipes to be inherited
+    by later ones. Having each child close every possible descriptor instead,
+    as C{close_fds} does, is slow when the limit is high.
+    """
+    _spawnLock.acquire()
+    try:
+        process = Popen(*args, **kwargs)
+        _cloexec(process.stdin, process.stdout, process.stderr)
+    finally:
+        _spawnLock.release()
+    return process
+
+_hooks = {'spawn':[], 'exit':[], 'pipeline':[]}
+
+def add_hook(event, callback):
+    """
+    Register C{callback} to be called with a L{Process} whenever C{event}
+    happens to it:
+
+        - C{spawn}: the process has just been started.
+        - C{exit}: the process has been reaped (or its result was found in a
+          cache); its L{Process.metrics} are complete.
+        - C{pipeline}: every process of the pipeline ending with this one has
+          been reaped.
+
+    @param event: C{spawn}, C{exit} or C{pipeline}
+    @type event: str
+    @param callback: The function to call
+    @type callback: callable
+    """
+    _hooks[event].append(callback)
+
+def remove_hook(event, callback):
+    """
+    Unregister a C{callback} registered with L{add_hook}.
+    """
+    _hooks[event].remove(callback)
+
+def _fire(event, proc):
+    for callback in list(_hooks[event]):
+        callback(proc)
+
+def _pump(streams, size=65536, feeds=None, deadline=None):
+    """
+    Read from several pipes concurrently until all of them reach end of file,
+    so that no child process can block on a full pipe buffer while another
+    stream is being read. Input may be written to other pipes at the same
+    time; it is consumed from its iterator only as fast as the pipe accepts
+    it.
+
+    Uses C{poll} where the platform provides it, and a thread per stream
+    otherwise.
+
+    @param streams: A mapping of names to open file objects to be read
+    @type streams: dict
+    @param size: The maximum number of bytes to read at a time
+    @type size: int
+    @param feeds: A mapping of open file objects to be written, and closed
+    afterwards, to iterators of the chunks to write to them
+    @type feeds: dict
+    @param deadline: The time by which every stream must be exhausted
+    @type deadline: float
+    @return: An iterator of C{(name, chunk)} pairs, in the order the data
+    arrived
+    @rtype: iterator
+    @raise Timeout: If the deadline passes first
+    """
+    if hasattr(select, 'poll'):
+        return _pollPump(streams, size, feeds or {}, deadline)
+    return _threadPump(streams, size, feeds or {}, deadline)
+
+def _write(fd, feed):
+    """
+    Write as much pending input to the non-blocking C{fd} as it will take.
+
+    @return: Whether all the input has been written, or the reading end of
+    the pipe has gone away
+    @rtype: bool
+    """
+    while True:
+        if not len(feed[1]):
+            try:
+                feed[1] = memoryview(feed[0].next())
+            except StopIteration:
+                return True
+            continue
+        try:
+            written = os.write(fd, feed[1])
+        except OSError, e:
+            if e.errno == errno.EAGAIN:
+                return False
+            if e.errno == errno.EPIPE:
+                return True
+            raise
+        feed[1] = feed[1][written:]
+
+def _pollPump(streams, size, feeds, deadline=None):
+    import fcntl
+    names = dict((f.fileno(), name) for name, f in streams.items())
+    writers = {}
+    poller = select.poll()
+    for fd in names:
+        poller.register(fd, select.POLLIN | select.POLLPRI)
+    for f, data in feeds.items():
+        fd = f.fileno()
+        fcntl.fcntl(fd, fcntl.F_SETFL,
+                    fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        writers[fd] = (f, [data, memoryview('')])
+        poller.register(fd, select.POLLOUT)
+    while names or writers:
+        remaining = _remaining(deadline)
+        try:
+            events = poller.poll(remaining and remaining * 1000)
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+        for fd, event in events:
+            if fd in writers:
+                if _write(fd, writers[fd][1]):
+                    poller.unregister(fd)
+                    writers.pop(fd)[0].close()
+                continue
+            chunk = os.read(fd, size)
+            if chunk:
+                yield names[fd], chunk
+            else:
+                poller.unregister(fd)
+                del names[fd]
+
+def _threadPump(streams, size, feeds, deadline=None):
+    queue = Queue.Queue(16)
+    def writer(f, data):
+        try:
+            for chunk in data:
+                f.write(chunk)
+        except IOError, e:
+            if e.errno != errno.EPIPE:
+                raise
+        f.close()
+    for f, data in feeds.items():
+        t = threading.Thread(target=writer, args=(f, data))
+        t.setDaemon(True)
+        t.start()
+    def reader(name, fd):
+        while True:
+            chunk = os.read(fd, size)
+            queue.put((name, chunk))
+            if not chunk:
+                break
+    for name, f in streams.items():
+        t = threading.Thread(target=reader, args=(name, f.fileno()))
+        t.setDaemon(True)
+        t.start()
+    remaining = len(streams)
+    while remaining:
+        try:
+            name, chunk = queue.get(True, _remaining(deadline))
+        except Queue.Empty:
+            raise Timeout()
+        if chunk:
+            yield name, chunk
+        else:
+            remaining -= 1
+
+class _Capture(object):
+    """
+    Accumulates output as the chunks read from a pipe, so that retrieving it
+    costs a single join rather than a copy on every write and another on
+    every read.
+
+    Once more than C{spill} bytes have been written, output is moved to a
+    temporary file instead, and retrieved as a read-only C{mmap} of it, so
+    that it is paged in by the OS as it is used rather than held in memory.
+    """
+    def __init__(self, spill=None):
+        self._chunks = []
+        self._size = 0
+        self._spill = spill
+        self._file = None
+        self._map = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def spilled(self):
+        return self._file is not None
+
+    def write(self, chunk):
+        if self._file is None and self._spill is not None \
+                and self._size + len(chunk) > self._spill:
+            self._file = tempfile.TemporaryFile()
+            for previous in self._chunks:
+                self._file.write(previous)
+            self._chunks = []
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._chunks.append(chunk)
+        self._size += len(chunk)
+
+    def getvalue(self):
+        if self._file is not None:
+            if self._map is None or len(self._map) != self._size:
+                self._file.flush()
+                self._map = mmap.mmap(self._file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            return self._map
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks and self._chunks[0] or ''
+
+    def view(self, strip):
+        """
+        Get the output, with surrounding whitespace removed if C{strip}.
+        Spilled output is stripped by taking a C{buffer} over part of its map,
+        rather than a copy.
+        """
+        value = self.getvalue()
+        if not strip:
+            return value
+        if self._file is None:
+            return value.strip()
+        start, end = 0, len(value)
+        while start < end and value[start].isspace():
+            start += 1
+        while end > start and value[end - 1].isspace():
+            end -= 1
+        return buffer(value, start, end - start)
+
+    def chunks(self, size=65536):
+        """
+        Iterate over the output in strings of at most C{size} bytes, or as a
+        single string if it was never spilled.
+        """
+        value = self.getvalue()
+        if self._file is None:
+            yield value
+        else:
+            for offset in xrange(0, len(value), size):
+                yield value[offset:offset + size]
+
+_libc = []
+
+def _posixSpawn():
+    """
+    Load the C library's C{posix_spawnp}, if it has one.
+
+    @return: The C library, or C{None} if it can't be used to spawn processes
+    @rtype: C{ctypes.CDLL}
+    """
+    if not _libc:
+        libc = None
+        try:
+            import ctypes, ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            libc.posix_spawnp
+        except (ImportError, OSError, AttributeError, TypeError):
+            libc = None
+        if not (os.path.isdir('/proc/self/fd') or os.path.isdir('/dev/fd')):
+            libc = None
+        _libc.append(libc)
+    return _libc[0]
+
+class _SpawnedProcess(object):
+    """
+    A stand-in for the parts of C{Popen} used by L{Process}, whose child is
+    started with C{posix_spawnp} rather than C{fork}. The C library can then
+    use C{vfork} semantics, so spawning costs the same however much memory
+    the parent is using.
+
+    The descriptors open in this process, read from C{/proc/self/fd} rather
+    than trying every possible one, are closed in the child. Pipes for other
+    processes are made under C{_spawnLock}, as is this one's child, so none
+    can leak into it from a thread spawning at the same time; a descriptor
+    opened concurrently by other code, and not close-on-exec, still may.
+    SIGPIPE is reset to its default action, so processes in a pipeline die
+    quietly when their reader does.
+    """
+    # Buffers comfortably larger than posix_spawn_file_actions_t,
+    # posix_spawnattr_t and sigset_t on any supported platform.
+    _opaque = 1024
+    _SETPGROUP = 0x02
+    _SETSIGDEF = 0x04
+    returncode = None
+
+    def __init__(self, args, executable=None, stdin=None, stdout=None,
+                 stderr=None, pgid=None):
+        import ctypes, fcntl
+        libc = _posixSpawn()
+        self.stdin = self.stdout = self.stderr = None
+        _spawnLock.acquire()
+        try:
+            parent, child = [], []
+            targets = []
+            for childfd, spec, mode in ((0, stdin, 'wb'), (1, stdout, 'rb'),
+                                        (2, stderr, 'rb')):
+                if spec == PIPE:
+                    r, w = os.pipe()
+                    for end in (r, w):
+                        # dup2 clears the flag on the child's copy.
+                        fcntl.fcntl(end, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+                    if mode == 'wb':
+                        fd, ours = r, w
+                    else:
+                        fd, ours = w, r
+                    parent.append(ours)
+                    child.append(fd)
+                    setattr(self, ('stdin', 'stdout', 'stderr')[childfd],
+                            os.fdopen(ours, mode, 0))
+                elif spec is None:
+                    fd = childfd
+                elif isinstance(spec, int):
+                    fd = spec
+                else:
+                    fd = spec.fileno()
+                targets.append((fd, childfd))
+
+            actions = ctypes.create_string_buffer(self._opaque)
+            attr = ctypes.create_string_buffer(self._opaque)
+            sigs = ctypes.create_string_buffer(self._opaque)
+            libc.posix_spawn_file_actions_init(actions)
+            libc.posix_spawnattr_init(attr)
+            try:
+                for fd, childfd in targets:
+                    if fd != childfd:
+                        libc.posix_spawn_file_actions_adddup2(actions, fd,
+                                                              childfd)
+                for fd in self._openfds():
+                    if fd > 2:
+                        libc.posix_spawn_file_actions_addclose(actions, fd)
+                libc.sigemptyset(sigs)
+                libc.sigaddset(sigs, signal.SIGPIPE)
+                libc.posix_spawnattr_setsigdefault(attr, sigs)
+                flags = self._SETSIGDEF
+                if pgid is not None:
+                    libc.posix_spawnattr_setpgroup(attr, pgid)
+                    flags |= self._SETPGROUP
+                libc.posix_spawnattr_setflags(attr, ctypes.c_short(flags))
+
+                argv = (ctypes.c_char_p * (len(args) + 1))(
+                    *(list(args) + [None]))
+                env = ['%s=%s' % item for item in os.environ.items()]
+                envp = (ctypes.c_char_p * (len(env) + 1))(*(env + [None]))
+                pid = ctypes.c_int()
+                err = libc.posix_spawnp(ctypes.byref(pid),
+                                        executable or args[0],
+                                        actions, attr, argv, envp)
+            finally:
+                libc.posix_spawn_file_actions_destroy(actions)
+                libc.posix_spawnattr_destroy(attr)
+                for fd in child:
+                    os.close(fd)
+        finally:
+            _spawnLock.release()
+        if err:
+            for f in (self.stdin, self.stdout, self.stderr):
+                if f is not None:
+                    f.close()
+            raise OSError(err, os.strerror(err))
+        self.pid = pid.value
+
+    @staticmethod
+    def _openfds():
+        for d in ('/proc/self/fd', '/dev/fd'):
+            if os.path.isdir(d):
+                return [int(fd) for fd in os.listdir(d)]
+        return []
+
+    def _handle_exitstatus(self, status):
+        if os.WIFSIGNALED(status):
+            self.returncode = -os.WTERMSIG(status)
+        elif os.WIFEXITED(status):
+            self.returncode = os.WEXITSTATUS(status)
+
+    def poll(self):
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                self._handle_exitstatus(status)
+        return self.returncode
+
+    def wait(self):
+        while self.returncode is None:
+            try:
+                pid, status = os.waitpid(self.pid, 0)
+            except OSError, e:
+                if e.errno != errno.EINTR:
+                    raise
+            else:
+                self._handle_exitstatus(status)
+        return self.returncode
+
+    def send_signal(self, sig):
+        os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+class _ThreadStage(object):
+    """
+    A stand-in for the parts of C{Popen} used by L{Process}, running a Python
+    generator function in a thread instead of a child process. The function
+    is given an iterator over the stage's input, read from a pipe like a
+    process's stdin, and whatever it yields is written to its stdout pipe.
+    Since pipes are bounded, neither side holds more than a pipe's worth of
+    data when the other falls behind.
+
+    An exception raised by the function is written to the stage's stderr, and
+    makes its return code 1.
+
+    A thread can't be killed, so SIGKILL abandons it instead: the stage
+    counts as dead at once, and once the caller has closed its ends of the
+    pipes the function stops the next time it reads, yields or writes.
+    """
+    pid = None
+    returncode = None
+
+    def __init__(self, func, lines, stdin):
+        self.stdin = None
+        _spawnLock.acquire()
+        try:
+            if stdin == PIPE:
+                source, w = os.pipe()
+                self.stdin = os.fdopen(w, 'wb', 0)
+            elif isinstance(stdin, int):
+                source = os.dup(stdin)
+            else:
+                # Our own copy, as a child process would have; the caller may
+                # close theirs.
+                source = os.dup(stdin.fileno())
+            r, self._out = os.pipe()
+            self.stdout = os.fdopen(r, 'rb', 0)
+            r, self._err = os.pipe()
+            self.stderr = os.fdopen(r, 'rb', 0)
+            # All the ends stay in this process; a child must not hold any.
+            _cloexec(source, self.stdin, self._out, self.stdout, self._err,
+                     self.stderr)
+        finally:
+            _spawnLock.release()
+        self._cancelled = None
+        self._thread = threading.Thread(target=self._run,
+                                        args=(func, lines, source))
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _input(self, lines, source):
+        if lines:
+            f = os.fdopen(source, 'rb')
+            try:
+                for line in iter(f.readline, ''):
+                    yield line
+            finally:
+                f.close()
+        else:
+            try:
+                for chunk in iter(lambda: os.read(source, 65536), ''):
+                    yield chunk
+            finally:
+                os.close(source)
+
+    def _run(self, func, lines, source):
+        returncode = 0
+        try:
+            try:
+                for chunk in func(self._input(lines, source)):
+                    if self._cancelled is not None:
+                        returncode = -self._cancelled
+                        break
+                    for chunk in _chunks(chunk):
+                        chunk = memoryview(chunk)
+                        while len(chunk):
+                            chunk = chunk[os.write(self._out, chunk):]
+            except OSError, e:
+                if e.errno != errno.EPIPE:
+                    raise
+        except:
+            try:
+                os.write(self._err, traceback.format_exc())
+            except OSError:
+                pass
+            returncode = 1
+        os.close(self._out)
+        os.close(self._err)
+        if self._cancelled is not None:
+            returncode = -self._cancelled
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        while self._thread.isAlive():
+            self._thread.join(0.1)
+        return self.returncode
+
+    def send_signal(self, sig):
+        """
+        Ask the function to stop; it does so the next time it yields. Its
+        thread isn't waited for after SIGKILL.
+        """
+        self._cancelled = sig
+        if sig == signal.SIGKILL:
+            self.returncode = -sig
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
 class Process(object):
     """
     A wrapper for subprocess.Popen that allows bash-like pipe syntax and
@@ -33,7 +689,8 @@ class Process(object):
     return code are requested. This removes the necessity of calling
     C{Popen().wait()} manually, or of capturing stdout and stderr from a
     C{communicate()} call. A small change, to be sure, but it helps reduce
-    overhead for a common pattern.
+    overhead for a common pattern. Until then, a L{Process} is only a
+    description of a command; nothing is spawned.
 
     One may use the C{|} operator to pipe the output of one L{Process} into
     another:
@@ -41,26 +698,108 @@ class Process(object):
         >>> p = Process("echo 'one two three'") | Process("wc -w")
         >>> print p.stdout
         3
-        
+
+    The whole pipeline is started at once when its output is requested, each
+    stage being spawned exactly once.
+
+    Setting C{fastspawn} (on the class, or per process) starts processes with
+    C{posix_spawn} instead of C{fork} where the platform allows it, which is
+    much cheaper from a parent using a lot of memory.
+
+    A process given a C{timeout} is killed, along with the rest of its
+    pipeline, if it hasn't finished that many seconds after being started;
+    L{Timeout} is then raised. Such a pipeline runs in a process group of its
+    own, so that anything its processes have started is killed with them: it
+    is first sent SIGTERM and, if still alive C{killgrace} seconds later,
+    SIGKILL.
+
+        >>> sh.sleep("5", timeout=0.1).retcode
+        Traceback (most recent call last):
+        ...
+        Timeout: sleep 5 timed out after 0.1 seconds
+
+    Results of deterministic commands may be memoized by giving a
+    L{cache.ResultCache} as C{cache}, or setting one as the C{cache} class
+    attribute.
+
+    Output is held in memory, unless C{spill} (on the class, or per process)
+    is set to a number of bytes: output beyond that goes to a temporary file,
+    and is then returned as a read-only C{mmap} of it (or, for L{stdout} and
+    L{stderr}, a C{buffer} over the stripped part of one) instead of a
+    string. A command may then produce more output than fits in memory:
+
+        >>> p = sh.seq("100000", spill=1024)
+        >>> out = p.stdout_bytes
+        >>> out.__class__, len(out), out[:6]
+        (<type 'mmap.mmap'>, 588895, '1\\n2\\n3\\n')
     """
+    fastspawn = False
+    killgrace = 1.0
+    cache = None
+    spill = None
+    _cacheable = True
     _stdin  = PIPE
     _stdout = PIPE
     _stderr = PIPE
     _retcode = None
+    _process = None
+    _upstream = None
+    _downstream = None
+    _reader = None
+    _executable = None
+    _pgid = None
+    _deadline = None
 
-    def __init__(self, cmd, stdin=None):
+    def __init__(self, cmd, stdin=None, strip=True, fastspawn=None,
+                 timeout=None, cache=None, spill=None):
         """
         @param cmd: A string or list containing the command to be executed.
         @type cmd: str, list
-        @param stdin: An optional open file object representing input to the
-        process.
-        @type stdin: file
+        @param stdin: Optional input to the process: an open file object, or
+        a string or iterable (a generator, for example) of strings to be
+        streamed into the process as it runs.
+        @type stdin: file, str, iterable
+        @param strip: Whether L{stdout} and L{stderr} should have surrounding
+        whitespace removed. Turn this off for binary output.
+        @type strip: bool
+        @param fastspawn: Whether to spawn with C{posix_spawn}; defaults to
+        the C{fastspawn} class attribute.
+        @type fastspawn: bool
+        @param timeout: The number of seconds the process, and any pipeline it
+        ends up in, may run before being killed.
+        @type timeout: float
+        @param cache: A cache in which to look up and store the results of the
+        pipeline ending with this process; defaults to the C{cache} class
+        attribute.
+        @type cache: L{cache.ResultCache}
+        @param spill: The number of bytes of output to hold in memory before
+        moving it to a temporary file; defaults to the C{spill} class
+        attribute, C{None} for no limit. Output that has been moved is
+        returned as a C{buffer} or C{mmap} rather than a C{str}; see
+        L{stdout}.
+        @type spill: int
         @rtype: void
         """
         self._command = _normalize(cmd)
-        if stdin is not None:
+        self._input = None
+        if isinstance(stdin, basestring) or not (stdin is None or
+                                                 hasattr(stdin, 'fileno')):
+            self._input = stdin
+        elif stdin is not None:
             self._stdin = stdin
-        self._refreshProcess()
+        self._strip = strip
+        if fastspawn is not None:
+            self.fastspawn = fastspawn
+        self._timeout = timeout
+        if cache is not None:
+            self.cache = cache
+        if spill is not None:
+            self.spill = spill
+        self._stdoutstorage = _Capture(self.spill)
+        self._stderrstorage = _Capture(self.spill)
+        self._pending = memoryview('')
+        self._nbytes = {'stdout':0, 'stderr':0}
+        self._elapsed = 0.0
 
     def __call__(self):
         """
@@ -71,19 +810,33 @@ class Process(object):
         """
         return self.stdout
 
+    def __iter__(self):
+        """
+        Iterate over the lines of the process output as they are produced.
+
+        @rtype: iterator
+        """
+        return self.iter_lines()
+
     def __or__(self, proc):
         """
         Override default C{or} comparison so that the C{|} operator will work.
         Don't call this directly.
 
-        @return: Process with C{self}'s stdin as stdout pipe.
+        @return: Process with C{self}'s stdout as stdin pipe.
         @rtype: L{Process}
         """
-        if self.hasExecuted or proc.hasExecuted:
-            raise AlreadyExecuted("You can't pipe processes after they've been"
-                                  "executed.")
-        proc._stdin = self._process.stdout
-        proc._refreshProcess()
+        if self._process is not None or proc._process is not None:
+            raise AlreadyExecuted("You can't pipe processes after they've "
+                                  "been started.")
+        head = proc
+        while head._upstream is not None:
+            head = head._upstream
+        if head._input is not None or head._stdin != PIPE:
+            raise ValueError("%s has its own stdin, so it can't be piped into"
+                             % " ".join(head._command))
+        head._upstream = self
+        self._downstream = weakref.ref(head)
         return proc
 
     @property
@@ -95,28 +848,325 @@ class Process(object):
         """
         return self._retcode is not None
 
-    def _refreshProcess(self):
+    def _stages(self):
+        """
+        List the processes of the pipeline ending with this one, in order.
+        """
+        stages = [self]
+        while stages[0]._upstream is not None:
+            stages.insert(0, stages[0]._upstream)
+        return stages
+
+    def _spawn(self):
+        """
+        Start every process of the pipeline ending with this one, unless that
+        has already been done.
+        """
+        if self._process is not None:
+            return
         if self.hasExecuted:
             raise AlreadyExecuted("")
-        try: del self._process
-        except AttributeError: pass
+        stages = self._stages()
+        timeouts = [stage._timeout for stage in stages
+                    if stage._timeout is not None]
+        if timeouts:
+            self._deadline = time.time() + min(timeouts)
+        stdin = stages[0]._stdin
+        group = 0
+        for stage in stages:
+            pgid = None
+            if timeouts:
+                pgid = group
+            try:
+                stage._start(stdin, pgid)
+            except OSError, e:
+                self._kill(signal.SIGKILL)
+                raise InvalidCommand(" ".join(stage._command))
+            _fire('spawn', stage)
+            group = group or stage._pgid or 0
+            if stage is not stages[0]:
+                # Only the downstream process should hold the read end of the
+                # pipe, so the upstream one sees SIGPIPE if it goes away.
+                stdin.close()
+            stdin = stage._process.stdout
+
+    def _start(self, stdin, pgid=None):
+        """
+        Spawn this process alone, in process group C{pgid} if one is given
+        (0 making it the leader of a new group).
+        """
+        if self.fastspawn and _posixSpawn() is not None:
+            spawn, options = _SpawnedProcess, {'pgid':pgid}
+        else:
+            spawn, options = _popen, {}
+            if pgid is not None:
+                options['preexec_fn'] = lambda: os.setpgid(0, pgid)
+        self._started = time.time()
+        self._process = spawn(self._command,
+                              stdin = stdin,
+                              stdout = self._stdout,
+                              stderr = self._stderr,
+                              executable = self._executable,
+                              **options)
+        self._spawntime = time.time() - self._started
+        if pgid is not None:
+            self._pgid = pgid or self._process.pid
+
+    def _kill(self, sig):
+        """
+        Send C{sig} to every running process of the pipeline ending with this
+        one, and to its process group if it has one.
+        """
+        stages = [stage for stage in self._stages()
+                  if stage._process is not None]
+        groups = [stage._pgid for stage in stages if stage._pgid]
+        if groups:
+            try: os.killpg(groups[0], sig)
+            except OSError: pass
+        for stage in stages:
+            if stage._process.returncode is None:
+                try: stage._process.send_signal(sig)
+                except OSError: pass
+
+    def _terminate(self):
+        """
+        Kill the pipeline ending with this process, politely at first, and
+        reap it.
+        """
+        procs = [stage._process for stage in self._stages()
+                 if stage._process is not None]
+        self._kill(signal.SIGTERM)
         try:
-            self._process = Popen(self._command, 
-                                  stdin = self._stdin,
-                                  stdout = self._stdout,
-                                  stderr = self._stderr)
-        except OSError, e:
-            raise InvalidCommand(" ".join(self._command))
+            _reap(procs, time.time() + self.killgrace)
+        except Timeout:
+            pass
+        # Also catches anything left behind in the group by exited stages.
+        self._kill(signal.SIGKILL)
+        _reap(procs)
+        for proc in procs:
+            for f in (proc.stdin, proc.stdout, proc.stderr):
+                if f is not None:
+                    f.close()
+
+    def _drain(self, size=65536):
+        """
+        Read stdout of the process and stderr of every stage of its pipeline
+        concurrently, storing stderr and yielding chunks of stdout as they
+        arrive, then reap the pipeline.
+        """
+        self._spawn()
+        stages = self._stages()
+        streams = {}
+        feeds = {}
+        for stage in stages:
+            if stage._input is not None:
+                feeds[stage._process.stdin] = _chunks(stage._input)
+            elif stage._process.stdin is not None:
+                stage._process.stdin.close()
+            streams[stage, 'stderr'] = stage._process.stderr
+        if not self._process.stdout.closed:
+            streams[self, 'stdout'] = self._process.stdout
+        start = time.time()
+        try:
+            for (stage, name), chunk in _pump(streams, size, feeds,
+                                              self._deadline):
+                stage._nbytes[name] += len(chunk)
+                if name == 'stdout':
+                    yield chunk
+                else:
+                    stage._stderrstorage.write(chunk)
+            _reap([stage._process for stage in stages], self._deadline)
+        except GeneratorExit:
+            # Whoever was reading the output stopped before the end of it.
+            self._terminate()
+            raise
+        except Timeout, e:
+            self._terminate()
+            timeout = min(stage._timeout for stage in stages
+                          if stage._timeout is not None)
+            e.args = ("%s timed out after %s seconds" % (
+                " ".join(self._command), timeout),)
+            e.stdout = self._stdoutstorage.getvalue()
+            e.stderr = "".join(stage._stderrstorage.getvalue()[:]
+                               for stage in stages)
+            raise
+        finally:
+            self._elapsed += time.time() - start
+            for stage in stages:
+                stage._retcode = stage._process.returncode
+                if stage.hasExecuted:
+                    _fire('exit', stage)
+            if self.hasExecuted:
+                _fire('pipeline', self)
 
     def _execute(self):
-        if not self.hasExecuted:
-            self._retcode = self._process.wait()
+        if self.hasExecuted:
+            return
+        downstream = self._downstream and self._downstream()
+        if downstream is not None:
+            # Our output belongs to the next process in the pipeline.
+            downstream._execute()
+        else:
+            key = self.cache is not None and self._cacheKey()
+            if key and self._fromCache(self.cache.get(key)):
+                return
+            for chunk in self._drain():
+                self._stdoutstorage.write(chunk)
+            stages = self._stages()
+            if key and not [s for s in stages if s._retcode != 0 or
+                            s._stdoutstorage.spilled or
+                            s._stderrstorage.spilled]:
+                self.cache.set(key, self._toCache())
+
+    def _cacheKey(self):
+        """
+        Identify the result of the pipeline ending with this process, for
+        caching: its commands, environment, working directory and input.
+
+        @return: The key, or C{None} if the input can't be identified
+        @rtype: tuple
+        """
+        stages = self._stages()
+        if [stage for stage in stages if not stage._cacheable]:
+            return None
+        data = stages[0]._input
+        if stages[0]._stdin != PIPE or not (data is None or
+                                            isinstance(data, basestring)):
+            return None
+        if data is not None:
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            data = hashlib.sha1(data).hexdigest()
+        return (tuple(tuple(stage._command) for stage in stages),
+                tuple(sorted(os.environ.items())), os.getcwd(), data)
+
+    def _toCache(self):
+        return (self._stdoutstorage.getvalue(),
+                [(stage._stderrstorage.getvalue(), stage._retcode)
+                 for stage in self._stages()])
+
+    def _fromCache(self, result):
+        """
+        Fill in the output and return codes of the pipeline ending with this
+        process from a cached C{result}, if there is one.
+
+        @rtype: bool
+        """
+        if result is None:
+            return False
+        stdout, stages = result
+        self._stdoutstorage.write(stdout)
+        self._nbytes['stdout'] += len(stdout)
+        for stage, (stderr, retcode) in zip(self._stages(), stages):
+            stage._stderrstorage.write(stderr)
+            stage._nbytes['stderr'] += len(stderr)
+            stage._retcode = retcode
+            _fire('exit', stage)
+        _fire('pipeline', self)
+        return True
+
+    def _checkTail(self):
+        """
+        Make sure this process's output isn't piped into another, before
+        reading it directly.
+        """
+        downstream = self._downstream and self._downstream()
+        if downstream is not None:
+            raise AlreadyExecuted("Output is piped into another process.")
+
+    def iter_chunks(self, size=65536):
+        """
+        Yield the output of the process in chunks of at most C{size} bytes as
+        soon as they are available, rather than waiting for the process to
+        finish. Output consumed this way is not stored, so memory use is
+        bounded by C{size} regardless of how much the process writes.
+
+        Closing the iterator before the output ends (by breaking out of a loop
+        over it, say) kills the pipeline, as a timeout would: its return codes
+        then show it was killed, and the rest of its output is lost.
+
+        @param size: The maximum size of each chunk
+        @type size: int
+        @return: An iterator over chunks of output
+        @rtype: iterator
+        """
+        if self.hasExecuted:
+            raise AlreadyExecuted("Output has already been collected.")
+        self._checkTail()
+        for chunk in self._drain(size):
+            yield chunk
+
+    def iter_lines(self, keepends=False, size=65536):
+        """
+        Yield the output of the process line by line as it is produced.
+
+            >>> for line in sh.seq("3"):
+            ...     print line
+            1
+            2
+            3
+
+        @param keepends: Whether to keep the trailing newline on each line
+        @type keepends: bool
+        @param size: The size of the chunks read from the process
+        @type size: int
+        @return: An iterator over lines of output
+        @rtype: iterator
+        """
+        partial = ''
+        for chunk in self.iter_chunks(size):
+            lines = (partial + chunk).split('\n')
+            partial = lines.pop()
+            for line in lines:
+                yield keepends and line + '\n' or line
+        if partial:
+            yield partial
+
+    def readinto(self, buffer):
+        """
+        Fill C{buffer}, a writable buffer such as a C{bytearray} or
+        C{memoryview}, with the next part of the process output, executing the
+        process first if necessary. Output is copied straight into the buffer
+        as it is read from the pipe, and is not stored otherwise; if the
+        process has already been executed, its stored output is read instead.
+
+            >>> p = sh.echo("spam and eggs")
+            >>> buf = bytearray(4)
+            >>> p.readinto(buf), buf
+            (4, bytearray(b'spam'))
+
+        @param buffer: The buffer to fill
+        @type buffer: bytearray, memoryview
+        @return: The number of bytes read, which is less than the size of the
+        buffer only once the output is exhausted
+        @rtype: int
+        """
+        if self._reader is None:
+            if self.hasExecuted:
+                self._reader = self._stdoutstorage.chunks()
+            else:
+                self._checkTail()
+                self._reader = self._drain()
+        view = memoryview(buffer)
+        filled = 0
+        while filled < len(view):
+            if not len(self._pending):
+                try:
+                    self._pending = memoryview(self._reader.next())
+                except StopIteration:
+                    break
+            size = min(len(view) - filled, len(self._pending))
+            view[filled:filled + size] = self._pending[:size]
+            self._pending = self._pending[size:]
+            filled += size
+        return filled
 
     def __str__(self):
-        return self.stdout
+        # Slicing makes a string of spilled output, whether a buffer or a map.
+        return self.stdout[:]
 
     def __repr__(self):
-        return self.stdout
+        return self.stdout[:]
 
     @property
     def stdout(self):
@@ -124,26 +1174,54 @@ class Process(object):
         Retrieve the contents of stdout, executing the process first if
         necessary.
 
+        Output spilled to a file (see C{spill}) is returned as a read-only
+        C{buffer} over a map of the file, or as the C{mmap} itself if it isn't
+        stripped. Neither compares equal to a C{str}; slicing either (C{[:]})
+        makes one.
+
         @return: The process output
-        @rtype: str
+        @rtype: str, buffer, mmap
         """
         self._execute()
-        if not hasattr(self, '_stdoutstorage'):
-            self._stdoutstorage = StringIO(self._process.stdout.read().strip())
-        return self._stdoutstorage.getvalue()
+        return self._stdoutstorage.view(self._strip)
 
     @property
     def stderr(self):
         """
         Retrieve the contents of stderr, executing the process first if
-        necessary.
+        necessary. Spilled output is returned as for L{stdout}.
 
-        @rtype: str
+        @rtype: str, buffer, mmap
+        @return: The process error output
+        """
+        self._execute()
+        return self._stderrstorage.view(self._strip)
+
+    @property
+    def stdout_bytes(self):
+        """
+        Retrieve the raw contents of stdout, never stripped, executing the
+        process first if necessary. No copy of the output is made beyond
+        joining the chunks read from the pipe; output spilled to a file (see
+        C{spill}) is returned as a read-only C{mmap} of it.
+
+        @rtype: str, mmap
+        @return: The process output
+        """
+        self._execute()
+        return self._stdoutstorage.getvalue()
+
+    @property
+    def stderr_bytes(self):
+        """
+        Retrieve the raw contents of stderr, never stripped, executing the
+        process first if necessary. Spilled output is returned as a read-only
+        C{mmap}, as for L{stdout_bytes}.
+
+        @rtype: str, mmap
         @return: The process error output
         """
         self._execute()
-        if not hasattr(self, '_stderrstorage'):
-            self._stderrstorage = StringIO(self._process.stderr.read().strip())
         return self._stderrstorage.getvalue()
 
     @property
@@ -158,26 +1236,129 @@ class Process(object):
         self._execute()
         return self._retcode
     
+    @property
+    def iostats(self):
+        """
+        Get the number of bytes collected from stdout and stderr, the time
+        spent collecting them and the resulting throughput, executing the
+        process first if necessary.
+
+        @rtype: dict
+        @return: A dictionary with the keys C{stdout}, C{stderr} (bytes),
+        C{elapsed} (seconds) and C{throughput} (bytes per second)
+        """
+        self._execute()
+        total = self._nbytes['stdout'] + self._nbytes['stderr']
+        return {'stdout':self._nbytes['stdout'],
+                'stderr':self._nbytes['stderr'],
+                'elapsed':self._elapsed,
+                'throughput':self._elapsed and total / self._elapsed or 0.0}
+
+    @property
+    def metrics(self):
+        """
+        Get what is known so far of the cost of running the process, without
+        executing it:
+
+            - C{command}: the command line
+            - C{pid}, C{retcode}: as for L{pid} and L{retcode}
+            - C{cached}: whether the result came from a cache
+            - C{spawn}: seconds taken to start the process
+            - C{wall}: seconds from starting the process to reaping it
+            - C{utime}, C{stime}: user and system CPU seconds it used
+            - C{maxrss}: its peak resident set size, in the platform's unit
+              (kilobytes on Linux)
+            - C{stdout}, C{stderr}: bytes read from it
+
+        Values that aren't known (yet) are C{None}.
+
+        @rtype: dict
+        """
+        proc = self._process
+        rusage = getattr(proc, 'rusage', None)
+        reaped = getattr(proc, 'reaped', None)
+        return {'command':" ".join(self._command),
+                'pid':proc and proc.pid,
+                'retcode':self._retcode,
+                'cached':proc is None and self.hasExecuted,
+                'spawn':proc and self._spawntime,
+                'wall':reaped and reaped - self._started,
+                'utime':rusage and rusage.ru_utime,
+                'stime':rusage and rusage.ru_stime,
+                'maxrss':rusage and rusage.ru_maxrss,
+                'stdout':self._nbytes['stdout'],
+                'stderr':self._nbytes['stderr']}
+
     @property
     def pid(self):
         """
         Get the pid of the executed process.
 
-        @return: The process pid
+        @return: The process pid, or C{None} if its result came from a cache
         @rtype: int
         """
         self._execute()
-        return self._process.pid
+        return self._process and self._process.pid
 
     def __del__(self):
         """
         Make dead sure the process has been cleaned up when garbage is
         collected.
         """
-        if self.hasExecuted:
-            try: os.kill(self.pid, 9)
-            except: pass
+        if self._process is not None and not self.hasExecuted:
+            try:
+                self._kill(signal.SIGKILL)
+                _reap([stage._process for stage in self._stages()])
+            except:
+                pass
+
+
+class _PyStage(Process):
+    """
+    A L{Process} whose work is done by a Python generator function, in a
+    thread of this process. See L{pyfilter}.
+    """
+    _cacheable = False
+
+    def __init__(self, func, lines=True, **kwargs):
+        Process.__init__(self, [getattr(func, '__name__', 'pyfilter')],
+                         **kwargs)
+        self._func = func
+        self._lines = lines
 
+    def _start(self, stdin, pgid=None):
+        self._started = time.time()
+        self._process = _ThreadStage(self._func, self._lines, stdin)
+        self._spawntime = time.time() - self._started
+
+def pyfilter(func, lines=True, **kwargs):
+    """
+    Make a pipeline stage out of a Python generator function, to filter or
+    transform data between processes without collecting it all first:
+
+        >>> def shout(lines):
+        ...     for line in lines:
+        ...         if "a" in line:
+        ...             yield line.upper()
+        >>> sh.printf(["spam\\neggs\\nham\\n"]) | pyfilter(shout) | sh.cat()
+        SPAM
+        HAM
+
+    C{func} is called with an iterator over the stage's input, and whatever
+    strings it yields become the stage's output. Data only flows through
+    pipes, so memory use is bounded however much of it passes through.
+
+    @param func: A generator function, or any callable that returns an
+    iterable of strings
+    @type func: callable
+    @param lines: Whether the input should be split into lines (each keeping
+    its newline), rather than arbitrary chunks
+    @type lines: bool
+    @param kwargs: Any other argument accepted by L{Process}, such as
+    C{stdin} or C{timeout}
+    @rtype: L{Process}
+    """
+    return _PyStage(func, lines, **kwargs)
 
 class _shell(object):
     """
@@ -191,11 +1372,153 @@ class _shell(object):
         >>> p._command
         ['wc', '-w']
 
+    Commands are looked up on C{PATH} once, when first used, and
+    L{InvalidCommand} is raised by the factory for one that can't be found,
+    before anything is spawned. Both the executables found and the factories
+    are cached until C{PATH} changes.
     """
+    def __init__(self):
+        self._path = None
+        self._factories = {}
+
     def __getattribute__(self, attr):
-        def inner(cmd=()):
+        path = os.environ.get('PATH', os.defpath)
+        if path != object.__getattribute__(self, '_path'):
+            self._path = path
+            self._factories = {}
+        factories = object.__getattribute__(self, '_factories')
+        try:
+            return factories[attr]
+        except KeyError:
+            pass
+        executable = _which(attr, path)
+        if executable is None:
+            def missing(cmd=(), **kwargs):
+                raise InvalidCommand(attr)
+            return missing
+        def inner(cmd=(), **kwargs):
             command = [attr]
             command.extend(_normalize(cmd))
-            return Process(command)
+            proc = Process(command, **kwargs)
+            proc._executable = executable
+            return proc
+        factories[attr] = inner
         return inner
 sh = _shell()
+
+
+def _cpuCount():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+def as_completed(cmds, max_workers=None):
+    """
+    Run many commands concurrently, no more than C{max_workers} at a time,
+    yielding results as the commands finish.
+
+    Each result is an C{(index, result)} pair, where C{index} is the position
+    of the command in C{cmds} and C{result} is the executed L{Process}. If
+    running a command raised an exception (an L{InvalidCommand}, for example),
+    the exception is yielded in place of the L{Process} and the rest of the
+    batch carries on. When the iterator is closed early (by breaking out of
+    a loop over it, or by an exception such as C{KeyboardInterrupt} while
+    waiting on it), commands not yet started are never run, and the
+    pipelines of those still running are killed.
+
+        >>> for i, p in as_completed([sh.sleep("0.2"), sh.true()], 2):
+        ...     print i, p.retcode
+        1 0
+        0 0
+
+    @param cmds: L{Process} objects (or objects like them, such as
+    L{session.SessionResult}), or commands to be turned into them
+    @type cmds: iterable
+    @param max_workers: The maximum number of commands to run at once;
+    defaults to the number of processors
+    @type max_workers: int
+    @return: An iterator of C{(index, result)} pairs in completion order
+    @rtype: iterator
+    """
+    procs = [isinstance(cmd, (basestring, list, tuple)) and Process(cmd) or cmd
+             for cmd in cmds]
+    todo = Queue.Queue()
+    for item in enumerate(procs):
+        todo.put(item)
+    done = Queue.Queue()
+    stop = threading.Event()
+    running = {}
+    def worker():
+        while not stop.isSet():
+            try:
+                index, proc = todo.get_nowait()
+            except Queue.Empty:
+                return
+            running[index] = proc
+            try:
+                proc._execute()
+            except Exception, e:
+                done.put((index, e))
+            else:
+                done.put((index, proc))
+            del running[index]
+    workers = []
+    for i in range(min(max_workers or _cpuCount(), len(procs))):
+        t = threading.Thread(target=worker)
+        t.setDaemon(True)
+        t.start()
+        workers.append(t)
+    try:
+        for i in range(len(procs)):
+            # Waiting without a timeout can't be interrupted in Python 2.
+            while True:
+                try:
+                    result = done.get(True, 0.1)
+                except Queue.Empty:
+                    continue
+                break
+            yield result
+    finally:
+        # If the caller stopped early, don't start any more commands, and
+        # kill those already running rather than waiting for them; including
+        # any a worker took just before being stopped, once spawned.
+        stop.set()
+        deadline = time.time() + Process.killgrace
+        killed = set()
+        while [t for t in workers if t.isAlive()]:
+            for index, proc in running.items():
+                if index not in killed and isinstance(proc, Process) and \
+                        proc._process is not None:
+                    killed.add(index)
+                    proc._terminate()
+            if time.time() > deadline:
+                break
+            time.sleep(0.01)
+
+def run_many(cmds, max_workers=None):
+    """
+    Run many commands concurrently, no more than C{max_workers} at a time, and
+    return the results in the order the commands were given.
+
+    Failures are collected rather than stopping the batch: if running a
+    command raised an exception, the exception takes the place of the
+    L{Process} in the result list.
+
+        >>> [p.stdout for p in run_many([sh.echo("a"), sh.echo("b")])]
+        ['a', 'b']
+
+    @param cmds: L{Process} objects (or objects like them, such as
+    L{session.SessionResult}), or commands to be turned into them
+    @type cmds: iterable
+    @param max_workers: The maximum number of commands to run at once;
+    defaults to the number of processors
+    @type max_workers: int
+    @return: The executed processes or the exceptions they raised
+    @rtype: list
+    """
+    results = {}
+    for index, result in as_completed(cmds, max_workers):
+        results[index] = result
+    return [results[i] for i in range(len(results))]
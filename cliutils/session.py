@@ -0,0 +1,274 @@
+__all__ = ['Session', 'SessionPool', 'SessionError']
+
+import os
+import errno
+import pipes
+import Queue
+import select
+import threading
+from subprocess import Popen, PIPE
+
+from process import _normalize, _cpuCount
+
+class SessionError(Exception):
+    """The shell of a session exited while running a command."""
+
+class _Frame(object):
+    """
+    Collects what a session's shell writes to one stream for one command,
+    which ends with C{token}, then anything up to a newline.
+    """
+    def __init__(self, token):
+        self.token = token
+        self._chunks = []
+        self._tail = ''
+
+    def feed(self, chunk):
+        """
+        @return: Whether the frame is complete
+        @rtype: bool
+        """
+        self._chunks.append(chunk)
+        window = self._tail + chunk
+        self._tail = window[-(len(self.token) + 16):]
+        return self.token in window and window.endswith('\n')
+
+    def value(self):
+        """
+        @return: What the command wrote, and what followed the token
+        @rtype: tuple
+        """
+        data = ''.join(self._chunks)
+        end = data.rfind(self.token)
+        return data[:end], data[end + len(self.token):-1]
+
+class SessionResult(object):
+    """
+    The result of a command run by a L{Session} or L{SessionPool}, with the
+    same interface as L{process.Process}: the command is run when and if its
+    stdout, stderr or return code are requested.
+    """
+    _retcode = None
+
+    def __init__(self, runner, cmd, strip=True):
+        self._runner = runner
+        self._command = _normalize(cmd)
+        self._strip = strip
+
+    def __call__(self):
+        return self.stdout
+
+    def __str__(self):
+        return self.stdout
+
+    def __repr__(self):
+        return self.stdout
+
+    @property
+    def hasExecuted(self):
+        return self._retcode is not None
+
+    def _execute(self):
+        if not self.hasExecuted:
+            self._stdout, self._stderr, self._retcode = \
+                self._runner._execute(self._command)
+
+    @property
+    def stdout(self):
+        self._execute()
+        if self._strip:
+            return self._stdout.strip()
+        return self._stdout
+
+    @property
+    def stderr(self):
+        self._execute()
+        if self._strip:
+            return self._stderr.strip()
+        return self._stderr
+
+    @property
+    def retcode(self):
+        self._execute()
+        return self._retcode
+
+class _Runner(object):
+    """
+    Creates L{SessionResult} objects for commands passed as attributes, like
+    L{process.sh}. Methods and private attributes shadow commands of the same
+    name; use L{run} for those.
+    """
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        def inner(cmd=(), **kwargs):
+            command = [attr]
+            command.extend(_normalize(cmd))
+            return SessionResult(self, command, **kwargs)
+        return inner
+
+    def run(self, cmd, strip=True):
+        """
+        Create a L{SessionResult} for C{cmd}, a string or list.
+
+        @rtype: L{SessionResult}
+        """
+        return SessionResult(self, cmd, strip)
+
+class Session(_Runner):
+    """
+    A long-lived shell coprocess that runs commands sent to it over a pipe,
+    saving the cost of spawning a process from Python for each command:
+
+        >>> session = Session()
+        >>> session.echo("spam and eggs")
+        spam and eggs
+        >>> session.sh(["-c", "echo oops >&2; exit 3"]).retcode
+        3
+        >>> session.close()
+
+    The output and exit code of each command are told apart by a random token
+    the shell prints after it. Commands run one at a time, with no input, in
+    the same shell; so C{cd} and C{export}, for example, affect the commands
+    that follow them. A command that can't be found exits with 127.
+
+    If the shell exits (because a command ran C{exit}, say), L{SessionError}
+    is raised and a new shell is started for the next command.
+    """
+    _process = None
+
+    def __init__(self, shell="/bin/sh"):
+        """
+        @param shell: The shell to run commands with
+        @type shell: str
+        @rtype: void
+        """
+        self._shell = shell
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._process = Popen([self._shell], stdin=PIPE, stdout=PIPE,
+                              stderr=PIPE, close_fds=True)
+        self._token = "__cliutils_%s__" % os.urandom(16).encode('hex')
+
+    def _execute(self, command):
+        """
+        Run C{command}, a list, in the shell.
+
+        @return: Its stdout, stderr and exit code
+        @rtype: tuple
+        """
+        self._lock.acquire()
+        try:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            script = ("%s </dev/null\n"
+                      "printf '%%s%%d\\n' %s \"$?\"\n"
+                      "printf '%%s\\n' %s >&2\n") % (
+                " ".join(pipes.quote(arg) for arg in command),
+                self._token, self._token)
+            try:
+                self._process.stdin.write(script)
+                return self._collect()
+            except (IOError, SessionError):
+                self._kill()
+                raise SessionError(" ".join(command))
+        finally:
+            self._lock.release()
+
+    def _collect(self):
+        frames = {self._process.stdout.fileno():_Frame(self._token),
+                  self._process.stderr.fileno():_Frame(self._token)}
+        pending = set(frames)
+        poller = select.poll()
+        for fd in frames:
+            poller.register(fd, select.POLLIN | select.POLLPRI)
+        while pending:
+            try:
+                events = poller.poll()
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd, event in events:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise SessionError()
+                if frames[fd].feed(chunk):
+                    poller.unregister(fd)
+                    pending.discard(fd)
+        stdout, retcode = frames[self._process.stdout.fileno()].value()
+        stderr = frames[self._process.stderr.fileno()].value()[0]
+        return stdout, stderr, int(retcode)
+
+    def _kill(self):
+        if self._process is not None:
+            try:
+                self._process.kill()
+            except OSError:
+                pass
+            self._process.wait()
+            for f in (self._process.stdin, self._process.stdout,
+                      self._process.stderr):
+                f.close()
+            self._process = None
+
+    def close(self):
+        """
+        Stop the shell.
+        """
+        self._lock.acquire()
+        try:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process.stdout.close()
+                self._process.stderr.close()
+                self._process = None
+        finally:
+            self._lock.release()
+
+    def __del__(self):
+        self._kill()
+
+class SessionPool(_Runner):
+    """
+    A pool of L{Session} objects, so that commands run from several threads
+    (by L{process.run_many}, for example) are spread over several shells:
+
+        >>> from cliutils.process import run_many
+        >>> pool = SessionPool(4)
+        >>> [r.stdout for r in run_many([pool.echo(str(i)) for i in range(5)])]
+        ['0', '1', '2', '3', '4']
+        >>> pool.close()
+
+    Which shell runs a command isn't defined, so commands that change the
+    state of their shell (C{cd}, C{export}) shouldn't be used with a pool.
+    """
+    def __init__(self, size=None, shell="/bin/sh"):
+        """
+        @param size: The number of shells; defaults to the number of
+        processors
+        @type size: int
+        @param shell: The shell to run commands with
+        @type shell: str
+        @rtype: void
+        """
+        self._sessions = [Session(shell) for i in range(size or _cpuCount())]
+        self._idle = Queue.Queue()
+        for session in self._sessions:
+            self._idle.put(session)
+
+    def _execute(self, command):
+        session = self._idle.get()
+        try:
+            return session._execute(command)
+        finally:
+            self._idle.put(session)
+
+    def close(self):
+        """
+        Stop every shell.
+        """
+        for session in self._sessions:
+            session.close()
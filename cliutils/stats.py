@@ -0,0 +1,106 @@
+__all__ = ['ProcessStats']
+
+import os
+import json
+import threading
+
+from process import add_hook, remove_hook
+
+class ProcessStats(object):
+    """
+    Aggregates the L{process.Process.metrics} of every process that exits
+    while it is installed, per command, to find where the time in a program's
+    pipelines goes.
+
+        >>> from cliutils.process import sh
+        >>> stats = ProcessStats().install()
+        >>> (sh.seq("1000") | sh.wc("-l")).stdout
+        '1000'
+        >>> stats.uninstall()
+        >>> report = stats.report()
+        >>> sorted(report), report['wc']['count'], report['wc']['stdout']
+        (['seq', 'wc'], 1, 5)
+
+    The report may be exported as JSON with L{dump}.
+    """
+    _fields = ('spawn', 'wall', 'utime', 'stime', 'stdout', 'stderr')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def install(self):
+        """
+        Start recording processes as they exit.
+
+        @return: This object
+        @rtype: L{ProcessStats}
+        """
+        add_hook('exit', self.record)
+        return self
+
+    def uninstall(self):
+        """
+        Stop recording processes.
+        """
+        remove_hook('exit', self.record)
+
+    def record(self, proc):
+        """
+        Add the metrics of C{proc}, an exited L{process.Process}, to the
+        totals for its command.
+        """
+        metrics = proc.metrics
+        name = os.path.basename(metrics['command'].split(" ")[0])
+        self._lock.acquire()
+        try:
+            totals = self._commands.setdefault(name,
+                dict.fromkeys(self._fields + ('count', 'failures', 'cached',
+                                              'maxrss'), 0))
+            totals['count'] += 1
+            totals['failures'] += metrics['retcode'] != 0
+            totals['cached'] += metrics['cached']
+            for field in self._fields:
+                totals[field] += metrics[field] or 0
+            totals['maxrss'] = max(totals['maxrss'], metrics['maxrss'] or 0)
+        finally:
+            self._lock.release()
+
+    def report(self):
+        """
+        Get the totals recorded so far for each command: the C{count} of
+        processes run, how many exited with a non-zero code (C{failures}) or
+        came from a cache (C{cached}), the sums of their C{spawn}, C{wall},
+        C{utime} and C{stime} seconds and of their C{stdout} and C{stderr}
+        bytes, their largest C{maxrss}, and the mean C{wall} time
+        (C{mean_wall}). Output piped from one process into another isn't seen,
+        and so isn't counted.
+
+        @return: The totals, keyed by command name
+        @rtype: dict
+        """
+        self._lock.acquire()
+        try:
+            report = {}
+            for name, totals in self._commands.items():
+                report[name] = dict(totals)
+                report[name]['mean_wall'] = totals['wall'] / totals['count']
+            return report
+        finally:
+            self._lock.release()
+
+    def dump(self, fobj):
+        """
+        Write the L{report} to the file-like object C{fobj} as JSON.
+        """
+        json.dump(self.report(), fobj, indent=2, sort_keys=True)
+
+    def reset(self):
+        """
+        Forget everything recorded so far.
+        """
+        self._lock.acquire()
+        try:
+            self._commands.clear()
+        finally:
+            self._lock.release()
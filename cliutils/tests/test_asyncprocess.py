@@ -0,0 +1,63 @@
+import unittest
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+except ImportError:
+    asyncio = None
+else:
+    from cliutils.asyncprocess import AsyncProcess, ash
+from cliutils.process import InvalidCommand
+
+@unittest.skipIf(asyncio is None, "trollius is not installed")
+class TestAsyncProcess(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.run = self.loop.run_until_complete
+
+    def test_getOutput(self):
+        p = AsyncProcess('echo "blah blah"')
+        self.assertEqual(self.run(p.stdout), "blah blah")
+        self.assertEqual(self.run(p.retcode), 0)
+
+    def test_lazy(self):
+        p = ash.echo("blah")
+        self.assertEqual(p._process, None)
+
+    def test_stderr(self):
+        p = ash.sh(["-c", "echo oops >&2; exit 3"])
+        self.assertEqual(self.run(p.stderr), "oops")
+        self.assertEqual(self.run(p.retcode), 3)
+
+    def test_pipe(self):
+        first = ash.echo("blah blah")
+        p = first | ash.wc("-w") | ash.cat()
+        self.assertEqual(self.run(p.stdout), "2")
+        self.assertEqual(self.run(first.retcode), 0)
+
+    def test_readline(self):
+        p = ash.seq("3") | ash.cat()
+        @asyncio.coroutine
+        def lines():
+            result = []
+            while True:
+                line = yield From(p.readline())
+                if line is None:
+                    break
+                result.append(line)
+            raise Return(result)
+        self.assertEqual(self.run(lines()), ["1", "2", "3"])
+
+    def test_concurrent(self):
+        procs = [ash.echo(str(i)) for i in range(50)]
+        results = self.run(asyncio.gather(*[p.stdout for p in procs]))
+        self.assertEqual(results, map(str, range(50)))
+
+    def test_raises(self):
+        p = ash.true() | ash.notacommand()
+        self.assertRaises(InvalidCommand, self.run, p.stdout)
+
+
+if __name__=="__main__":
+    unittest.main()
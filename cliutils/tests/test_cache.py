@@ -0,0 +1,100 @@
+import unittest
+
+import os
+import time
+import shutil
+import tempfile
+
+from cliutils import process
+from cliutils.cache import ResultCache
+from cliutils.process import Process, sh
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.spawned = []
+        self.realPopen = process.Popen
+        def Popen(cmd, **kwargs):
+            self.spawned.append(cmd[0])
+            return self.realPopen(cmd, **kwargs)
+        process.Popen = Popen
+
+    def tearDown(self):
+        process.Popen = self.realPopen
+
+    def test_hit(self):
+        cache = ResultCache()
+        self.assertEqual(sh.echo("spam", cache=cache).stdout, "spam")
+        p = sh.echo("spam", cache=cache)
+        self.assertEqual(p.stdout, "spam")
+        self.assertEqual(p.retcode, 0)
+        self.assertEqual(p.pid, None)
+        self.assertEqual(self.spawned, ["echo"])
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+
+    def test_key(self):
+        cache = ResultCache()
+        sh.cat(stdin="spam", cache=cache).stdout
+        self.assertEqual(sh.cat(stdin="eggs", cache=cache).stdout, "eggs")
+        self.assertEqual(sh.cat(stdin="spam", cache=cache).stdout, "spam")
+        os.environ['CLIUTILS_TEST'] = '1'
+        try:
+            sh.cat(stdin="spam", cache=cache).stdout
+        finally:
+            del os.environ['CLIUTILS_TEST']
+        self.assertEqual(self.spawned, ["cat", "cat", "cat"])
+
+    def test_pipeline(self):
+        cache = ResultCache()
+        first = sh.sh(["-c", "echo a b c; echo note >&2"], cache=cache)
+        p = first | sh.wc(["-w"], cache=cache)
+        self.assertEqual(p.stdout, "3")
+        first = sh.sh(["-c", "echo a b c; echo note >&2"])
+        p = first | sh.wc(["-w"], cache=cache)
+        self.assertEqual(p.stdout, "3")
+        self.assertEqual(first.stderr, "note")
+        self.assertEqual(first.retcode, 0)
+        self.assertEqual(self.spawned, ["sh", "wc"])
+
+    def test_uncacheable(self):
+        cache = ResultCache()
+        sh.false(cache=cache).retcode
+        sh.false(cache=cache).retcode
+        sh.cat(stdin=iter(["a"]), cache=cache).stdout
+        sh.cat(stdin=iter(["a"]), cache=cache).stdout
+        self.assertEqual(self.spawned, ["false", "false", "cat", "cat"])
+
+    def test_lru(self):
+        cache = ResultCache(maxsize=2)
+        for word in ("a", "b", "a", "c", "a", "b"):
+            sh.echo(word, cache=cache).stdout
+        self.assertEqual(self.spawned, ["echo", "echo", "echo", "echo"])
+        self.assertEqual(cache.stats['evictions'], 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.05)
+        sh.echo("a", cache=cache).stdout
+        time.sleep(0.1)
+        sh.echo("a", cache=cache).stdout
+        self.assertEqual(len(self.spawned), 2)
+        self.assertEqual(cache.stats['expired'], 1)
+
+    def test_disk(self):
+        d = tempfile.mkdtemp()
+        try:
+            cache = ResultCache(filename="results", directory=d)
+            sh.echo("a", cache=cache).stdout
+            cache.close()
+            cache = ResultCache(filename="results", directory=d)
+            self.assertEqual(sh.echo("a", cache=cache).stdout, "a")
+            self.assertEqual(cache.stats['disk_hits'], 1)
+            self.assertEqual(len(self.spawned), 1)
+            cache.close()
+        finally:
+            shutil.rmtree(d)
+
+
+if __name__=="__main__":
+    unittest.main()
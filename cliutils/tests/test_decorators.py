@@ -63,6 +63,65 @@ class TestDecorators(unittest.TestCase):
         result = sys.stdout.read()
         self.assertEqual(result.strip(), "Usage information")
 
+    def test_cliargs_options(self):
+        @cliargs
+        def func(path, count=1, ratio=0.5, verbose=False, name=None,
+                 dry_run=False):
+            return path, count, ratio, verbose, name, dry_run
+        sys.argv[:] = ['executable', '--count=3', 'file', '--ratio', '2',
+                       '--verbose', '--dry-run', '--name']
+        self.assertEqual(func(), ('file', 3, 2.0, True, True, True))
+        sys.argv[:] = ['executable', '--verbose=no', '--', '--file']
+        self.assertEqual(func(), ('--file', 1, 0.5, False, None, False))
+
+    def test_cliargs_positional_coercion(self):
+        @cliargs
+        def func(path, count=1, verbose=False, *rest):
+            return path, count, verbose, rest
+        sys.argv[:] = ['executable', 'p', '3', 'yes', 'x']
+        self.assertEqual(func(), ('p', 3, True, ('x',)))
+        sys.stdout = StringIO()
+        sys.argv[:] = ['executable', 'p', 'three']
+        self.assertEqual(func(), None)
+        sys.stdout = sys.__stdout__
+
+    def test_cliargs_trailing_flag(self):
+        @cliargs
+        def func(*args, **kwargs):
+            return args, kwargs
+        sys.argv[:] = ['executable', 'a', '-b']
+        self.assertEqual(func(), (('a',), {'b':True}))
+
+    def test_cliargs_long(self):
+        @cliargs
+        def func(*args, **kwargs):
+            return len(args), len(kwargs)
+        sys.argv[:] = ['executable'] + ['file'] * 100000 + ['--opt', 'value']
+        self.assertEqual(func(), (100000, 1))
+
+    def test_cliargs_usage(self):
+        @cliargs
+        def func(a, b=1):
+            "Usage information"
+            return a, b
+        sys.stdout = StringIO()
+        for argv in (['x', 'y', 'z'], [], ['x', '--b', 'two'], ['x', '--b'],
+                     ['x', '--c', '1'], ['x', '--a', 'y']):
+            sys.argv[:] = ['executable'] + argv
+            self.assertEqual(func(), None)
+        output = sys.stdout.getvalue()
+        sys.stdout = sys.__stdout__
+        self.assertEqual(output.split(), ["Usage", "information"] * 6)
+        sys.argv[:] = ['executable', '--a', 'x']
+        self.assertEqual(func(), ('x', 1))
+
+    def test_cliargs_inner_typeerror(self):
+        @cliargs
+        def func():
+            return len(1)
+        sys.argv[:] = ['executable']
+        self.assertRaises(TypeError, func)
+
     def test_redirect(self):
         s = StringIO()
         token = "ABCDEFG"
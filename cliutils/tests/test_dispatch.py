@@ -0,0 +1,109 @@
+import unittest
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from cliutils.dispatch import commands
+
+FIRST = '''
+from cliutils.decorators import cliargs
+
+@cliargs
+def greet(name, greeting="Hello", times=1):
+    """Greet someone.
+
+    Usage: greet NAME [--greeting WORD] [--times N]
+    """
+    return [greeting + ", " + name] * times
+'''
+
+SECOND = '''
+def add(*numbers):
+    """Add up some numbers."""
+    return sum(int(n) for n in numbers)
+'''
+
+class TestDispatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, source in (("dispatchfirst", FIRST),
+                             ("dispatchsecond", SECOND)):
+            f = open(os.path.join(self.directory, name + ".py"), 'w')
+            f.write(source)
+            f.close()
+        sys.path.insert(0, self.directory)
+        self.table = {'greet':'dispatchfirst:greet',
+                      'add':'dispatchsecond:add'}
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        sys.path.remove(self.directory)
+        for name in ("dispatchfirst", "dispatchsecond"):
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.directory)
+
+    def test_dispatch(self):
+        main = commands(self.table, prog='tool')
+        self.assertEqual(main(['add', '1', '2', '3']), 6)
+        self.assertFalse('dispatchfirst' in sys.modules)
+        self.assertEqual(main(['greet', 'you', '--times=2']),
+                         ["Hello, you", "Hello, you"])
+        argv = sys.argv[:]
+        self.assertEqual(main(['greet', '--greeting', 'Hi', 'me']), ["Hi, me"])
+        self.assertEqual(sys.argv, argv)
+
+    def test_usage(self):
+        main = commands(self.table, prog='tool')
+        self.assertEqual(main([]), 2)
+        self.assertEqual(main(['help']), None)
+        self.assertEqual(main(['greet', '--help']), None)
+        self.assertEqual(main(['help', 'greet']), None)
+        output = sys.stdout.getvalue()
+        usage = ("Usage: tool COMMAND [ARGS...]\n\nCommands:\n"
+                 "  add    Add up some numbers.\n"
+                 "  greet  Greet someone.\n")
+        self.assert_(output.startswith(usage * 2))
+        self.assertEqual(output.count("Usage: greet NAME"), 2)
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertEqual(main(['nothing']), 2)
+            self.assert_("Unknown command: nothing" in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+
+    def test_index_cache(self):
+        cache = os.path.join(self.directory, "index.json")
+        self.assertEqual(commands(self.table, cache=cache).index(),
+                         {'greet':"Greet someone.",
+                          'add':"Add up some numbers."})
+        self.assert_(os.path.exists(cache))
+        for name in ("dispatchfirst", "dispatchsecond"):
+            del sys.modules[name]
+        self.assertEqual(commands(self.table, cache=cache).index()['add'],
+                         "Add up some numbers.")
+        self.assertFalse('dispatchfirst' in sys.modules or
+                         'dispatchsecond' in sys.modules)
+        # A command whose module changes is looked at again.
+        filename = os.path.join(self.directory, "dispatchsecond.py")
+        f = open(filename, 'w')
+        f.write(SECOND.replace("Add up", "Sum"))
+        f.close()
+        later = time.time() + 10
+        os.utime(filename, (later, later))
+        for name in os.listdir(self.directory):
+            if name.endswith('.pyc'):
+                os.remove(os.path.join(self.directory, name))
+        self.assertEqual(commands(self.table, cache=cache).index()['add'],
+                         "Sum some numbers.")
+        self.assertFalse('dispatchfirst' in sys.modules)
+
+
+if __name__=="__main__":
+    unittest.main()
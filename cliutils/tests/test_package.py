@@ -0,0 +1,59 @@
+import unittest
+
+import os
+import sys
+from subprocess import Popen, PIPE
+
+import cliutils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+def imported(statement):
+    """
+    Run C{statement} in a fresh interpreter, and list the modules it loaded.
+    """
+    script = ("import sys; before = set(sys.modules)\n%s\n"
+              "print '\\n'.join(sorted(set(sys.modules) - before))"
+              % statement)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    p = Popen([sys.executable, "-c", script], stdout=PIPE, env=env)
+    return p.communicate()[0].split()
+
+class TestPackage(unittest.TestCase):
+    def test_startup(self):
+        modules = imported("import cliutils")
+        for heavy in ('subprocess', 'shelve', 'ConfigParser', 'threading',
+                      'cliutils.process', 'cliutils.persistence',
+                      'cliutils.decorators'):
+            self.assertFalse(heavy in modules, heavy)
+
+    def test_partial_import(self):
+        modules = imported("from cliutils import cliargs")
+        self.assert_('cliutils.decorators' in modules)
+        self.assertFalse('cliutils.process' in modules)
+        self.assertFalse('cliutils.persistence' in modules)
+
+    def test_persistence_import(self):
+        # Storage backends and codecs are only imported once used.
+        modules = imported("from cliutils import config")
+        self.assert_('cliutils.persistence' in modules)
+        for heavy in ('sqlite3', 'json', 'bz2', 'anydbm', 'hashlib',
+                      'tempfile'):
+            self.assertFalse(heavy in modules, heavy)
+
+    def test_names(self):
+        from cliutils import process, decorators, persistence
+        self.assert_(cliutils.sh is process.sh)
+        self.assert_(cliutils.Process is process.Process)
+        self.assert_(cliutils.cliargs is decorators.cliargs)
+        self.assert_(cliutils.db is persistence.db)
+        self.assert_(cliutils.config is persistence.config)
+        self.assert_(cliutils.storage_dir is persistence.storage_dir)
+        self.assert_(cliutils.persistence is persistence)
+        self.assertRaises(AttributeError, getattr, cliutils, 'nothing')
+        self.assertEqual(cliutils.__version__, "0.1.3")
+
+
+if __name__=="__main__":
+    unittest.main()
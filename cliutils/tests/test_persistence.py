@@ -1,9 +1,13 @@
 import unittest
 
 import os
+import sys
+import shutil
+from subprocess import Popen
 import tempfile
 
-from cliutils.persistence import storage_dir, ConfigStorage
+from cliutils.persistence import storage_dir, ConfigStorage, CachedDB, db
+from cliutils.persistence import SQLiteDB, Codec
 
 class TestPersistence(unittest.TestCase):
     def test_storage_dir(self):
@@ -35,6 +39,272 @@ class TestPersistence(unittest.TestCase):
         self.assertEqual(config2.keys(), ['sec1'])
         self.assertEqual(config2['sec1'].items(), [('option2', '75'),])
 
+    def test_config_batch(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "batch.cfg")
+        writes = []
+        class Counting(ConfigStorage):
+            def _write(self):
+                writes.append(self.filename)
+                ConfigStorage._write(self)
+        config = Counting(filename)
+        del writes[:]
+        with config.batch():
+            for i in range(100):
+                config['batch']['option%d' % i] = i
+            with config.batch():
+                config['batch']['nested'] = 1
+            self.assertEqual(writes, [])
+        self.assertEqual(writes, [filename])
+        self.assertEqual(ConfigStorage(filename)['batch']['option99'], '99')
+        shutil.rmtree(directory)
+
+    def test_config_atomic(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "atomic.cfg")
+        config = ConfigStorage(filename, fsync=True)
+        os.chmod(filename, 0640)
+        config['atomic']['option'] = 1
+        self.assertEqual(os.listdir(directory), ["atomic.cfg"])
+        self.assertEqual(os.stat(filename).st_mode & 0777, 0640)
+        self.assert_("option = 1" in open(filename).read())
+        shutil.rmtree(directory)
+
+    def test_config_shared(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "shared.cfg")
+        config = ConfigStorage(filename)
+        config['shared']['option'] = 1
+        other = ConfigStorage(filename)
+        self.assert_(other._config is config._config)
+        self.assertEqual(other['shared']['option'], '1')
+        self.assertEqual(ConfigStorage(tempfile.mkstemp()[1]).sections(), [])
+        shutil.rmtree(directory)
+
+    def test_config_reload(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "reload.cfg")
+        config = ConfigStorage(filename)
+        config['reload']['mine'] = 1
+        loads = []
+        original = config.load
+        config.load = lambda: loads.append(1) or original()
+        config['reload']
+        self.assertEqual(loads, [])
+        # Another process adds an option.
+        f = open(filename, 'a')
+        f.write("theirs = 2\n")
+        f.close()
+        self.assertEqual(config['reload']['theirs'], '2')
+        self.assertEqual(len(loads), 1)
+        # Saving keeps it, and our own changes.
+        config['reload']['mine'] = 3
+        self.assertEqual(ConfigStorage(filename)['reload'].items(),
+                         [('mine', '3'), ('theirs', '2')])
+        shutil.rmtree(directory)
+
+    def test_config_locked(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "locked.cfg")
+        ConfigStorage(filename)
+        script = ("import sys; sys.path.insert(0, %r)\n"
+                  "from cliutils.persistence import ConfigStorage\n"
+                  "config = ConfigStorage(%r)\n"
+                  "for i in range(20):\n"
+                  "    config['s%%s' %% sys.argv[1]]['o%%d' %% i] = i\n") % (
+            os.path.dirname(os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__)))), filename)
+        workers = [Popen([sys.executable, "-c", script, str(n)])
+                   for n in range(4)]
+        for worker in workers:
+            self.assertEqual(worker.wait(), 0)
+        config = ConfigStorage(filename)
+        self.assertEqual(sorted(config.sections()), ['s0', 's1', 's2', 's3'])
+        for n in range(4):
+            self.assertEqual(len(config['s%d' % n].keys()), 20)
+        shutil.rmtree(directory)
+
+    def test_section_access(self):
+        config = ConfigStorage(tempfile.mkstemp()[1])
+        section = config['access']
+        self.assertFalse('missing' in section)
+        with config.batch():
+            section['a'] = 1
+            section['b'] = 2
+        self.assert_('a' in section and section.has_option('b'))
+        self.assertEqual(list(section), ['a', 'b'])
+        self.assertEqual(section.values(), ['1', '2'])
+        self.assertEqual(section.get('a'), '1')
+        self.assertEqual(section.get('c'), None)
+        self.assertEqual(section.get('c', 'x'), 'x')
+
+    def test_section_typed(self):
+        filename = tempfile.mkstemp()[1]
+        config = ConfigStorage(filename)
+        section = config['typed']
+        section['int'] = 42
+        section['float'] = 1.5
+        section['bool'] = "Yes"
+        section['list'] = "a, b,, c "
+        self.assertEqual(section.getint('int'), 42)
+        self.assertEqual(section.getfloat('float'), 1.5)
+        self.assertEqual(section.getbool('bool'), True)
+        self.assertEqual(section.getlist('list'), ['a', 'b', 'c'])
+        self.assertEqual(section.getlist('list', sep=" "), ['a,', 'b,,', 'c'])
+        self.assertEqual(section.getint('missing', 7), 7)
+        self.assertRaises(ValueError, section.getbool, 'list')
+        self.assertEqual(config['typed']._converted[('int', 'int')], 42)
+        section['int'] = 43
+        self.assertEqual(config['typed'].getint('int'), 43)
+        # A change made by another process is seen too.
+        f = open(filename, 'a')
+        f.write("float = 2.5\n")
+        f.close()
+        self.assertEqual(config['typed'].getfloat('float'), 2.5)
+        self.assertEqual(section.getfloat('float'), 2.5)
+
+    def test_db_cached(self):
+        class Store(dict):
+            writes = 0
+            def __setitem__(self, key, value):
+                self.writes += 1
+                dict.__setitem__(self, key, value)
+            def sync(self):
+                pass
+            def close(self):
+                pass
+        store = Store(('key%d' % i, [i]) for i in range(10))
+        d = CachedDB(store, cachesize=3)
+        for i in range(10):
+            self.assertEqual(d['key%d' % i], [i])
+        self.assertEqual(len(d._cache), 3)
+        self.assertEqual(store.writes, 0)
+        d['key9'].append(9)
+        d['key8'] = 'eight'
+        d.flush()
+        self.assertEqual(store.writes, 2)
+        self.assertEqual(store['key9'], [9, 9])
+        d.flush()
+        self.assertEqual(store.writes, 2)
+        del d['key8']
+        self.assertFalse('key8' in d or 'key8' in store)
+        self.assertEqual(len(d), 9)
+        stats = d.stats
+        self.assertEqual((stats['hits'], stats['misses']), (1, 10))
+        self.assertEqual(stats['evictions'], 7)
+
+    def test_db_flushinterval(self):
+        directory = tempfile.mkdtemp()
+        d = db("flush.db", directory, cachesize=10, flushinterval=0)
+        d['spam'] = 'eggs'
+        self.assertEqual(d.store['spam'], 'eggs')
+        d.close()
+        d = db("flush.db", directory, cachesize=10)
+        self.assertEqual(d['spam'], 'eggs')
+        d.close()
+        shutil.rmtree(directory)
+
+    def test_db_cached_collected(self):
+        directory = tempfile.mkdtemp()
+        d = db("collected.db", directory, cachesize=10)
+        d['key'] = [1]
+        del d
+        d = db("collected.db", directory, cachesize=10)
+        self.assertEqual(d.get('key'), [1])
+        d.close()
+        d.close()
+        shutil.rmtree(directory)
+
+    def test_db_sqlite(self):
+        directory = tempfile.mkdtemp()
+        d = db("sqlite.db", directory, backend="sqlite")
+        self.assert_(isinstance(d, SQLiteDB))
+        d['spam'] = [1, 2]
+        d.update_many(('key%d' % i, i) for i in range(1000))
+        self.assertEqual(len(d), 1001)
+        self.assertEqual(d.get_many(['key1', 'key999', 'missing', 'spam']),
+                         {'key1':1, 'key999':999, 'spam':[1, 2]})
+        self.assertEqual(sum(1 for key in d), 1001)
+        self.assertEqual(dict(d.iteritems())['key5'], 5)
+        del d['spam']
+        self.assertRaises(KeyError, lambda: d['spam'])
+        self.assertFalse('spam' in d)
+        self.assertRaises(KeyError, d.__delitem__, 'spam')
+        self.assertRaises(ValueError, d.update_many, [('bad', 1), ('pair',)])
+        self.assertFalse('bad' in d)
+        # Another connection, as from another process, sees the same data.
+        other = SQLiteDB(d.filename)
+        self.assertEqual(other['key10'], 10)
+        other.close()
+        d.close()
+        d = db("sqlite.db", directory, cachesize=10, backend="sqlite")
+        self.assertEqual(d['key20'], 20)
+        d.close()
+        self.assertRaises(ValueError, db, "x.db", directory, backend="bdb")
+        shutil.rmtree(directory)
+
+    def test_codec(self):
+        value = {'spam':['eggs'] * 1000}
+        for serializer in ("pickle", "marshal", "json"):
+            for compress in (None, "zlib", "bz2"):
+                codec = Codec(serializer, compress)
+                self.assertEqual(codec.loads(codec.dumps(value)), value)
+                self.assertEqual(codec.stats['compressed'],
+                                 compress and 1 or 0)
+        codec = Codec((repr, eval), threshold=10)
+        self.assertEqual(codec.loads(codec.dumps((1, 2))), (1, 2))
+        # Small values aren't compressed, and reading doesn't depend on the
+        # compression set.
+        codec = Codec(compress="zlib", threshold=100)
+        small, large = codec.dumps("a"), codec.dumps("a" * 1000)
+        self.assertEqual(codec.stats['compressed'], 1)
+        self.assert_(len(large) < 100)
+        self.assertEqual(Codec().loads(large), "a" * 1000)
+        self.assertEqual(Codec().loads(small), "a")
+        self.assertRaises(ValueError, Codec, "yaml")
+        self.assertRaises(ValueError, Codec, compress="rar")
+
+    def test_db_codec(self):
+        directory = tempfile.mkdtemp()
+        for backend in ("shelve", "sqlite"):
+            filename = "codec-%s.db" % backend
+            d = db(filename, directory, backend=backend, codec="json",
+                   compress="zlib", threshold=64)
+            d['small'] = [1]
+            d['large'] = ["spam"] * 100
+            sizes = d.sizes()
+            self.assert_(sizes['small'] < sizes['large'] < 100)
+            d.close()
+            d = db(filename, directory, backend=backend, codec="json")
+            self.assertEqual(d['large'], [u"spam"] * 100)
+            d.close()
+        self.assertRaises(ValueError, db, "x.db", directory, codec=Codec(),
+                          compress="zlib")
+        self.assertRaises(ValueError, db, "x.db", directory, codec=Codec(),
+                          threshold=10)
+        self.assertRaises(ValueError, db, "x.db", directory, codec="json",
+                          threshold=10)
+        # A threshold of 0 compresses values however small.
+        d = db("zero.db", directory, compress="zlib", threshold=0)
+        d['small'] = "a" * 100
+        self.assert_(d.sizes()['small'] < 100)
+        d.close()
+        shutil.rmtree(directory)
+
+    def test_db_sizes(self):
+        directory = tempfile.mkdtemp()
+        for kwargs in ({}, {'cachesize':10}, {'codec':"json", 'cachesize':10},
+                       {'backend':"sqlite", 'cachesize':10}):
+            d = db("sizes.db", directory, **kwargs)
+            d['small'] = 1
+            d['large'] = "spam" * 100
+            sizes = d.sizes()
+            self.assert_(sizes['small'] < 400 < sizes['large'], kwargs)
+            d.close()
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+        shutil.rmtree(directory)
+
 
 if __name__=="__main__":
     unittest.main()
@@ -1,5 +1,13 @@
 import unittest
-from cliutils.process import Process, sh, InvalidCommand
+
+import os
+import time
+import shutil
+import tempfile
+from cliutils import process
+from cliutils.process import Process, sh, InvalidCommand, AlreadyExecuted
+from cliutils.process import Timeout
+from cliutils.process import run_many, as_completed
 
 class TestProcess(unittest.TestCase):
 
@@ -31,6 +39,8 @@ class TestProcess(unittest.TestCase):
 
     def test_raises(self):
         self.assertRaises(InvalidCommand, sh.notacommand)
+        self.assertRaises(InvalidCommand,
+                          lambda: Process("notacommand").stdout)
 
     def test_stdout_again(self):
         p = sh.echo("blah blah")
@@ -38,6 +48,445 @@ class TestProcess(unittest.TestCase):
         # Access it again
         self.assertEqual(p.stdout, "blah blah")
 
+    def test_iter_lines(self):
+        p = sh.seq("3")
+        self.assertEqual(list(p), ["1", "2", "3"])
+        self.assertEqual(p.retcode, 0)
+        p = sh.printf(["a\nb"])
+        self.assertEqual(list(p.iter_lines(keepends=True)), ["a\n", "b"])
+
+    def test_iter_chunks(self):
+        p = sh.seq("1000")
+        chunks = list(p.iter_chunks(10))
+        self.assert_(max(map(len, chunks)) <= 10)
+        self.assertEqual("".join(chunks).split(), map(str, range(1, 1001)))
+
+    def test_iter_break(self):
+        first = sh.yes()
+        p = first | sh.cat()
+        for line in p:
+            break
+        self.assert_(p.retcode < 0)
+        self.assert_(first.retcode < 0)
+        self.assertRaises(AlreadyExecuted, list, p)
+
+    def test_iter_pipe(self):
+        p = sh.seq("20") | sh.grep("1")
+        self.assertEqual(list(p), ["1", "10", "11", "12", "13", "14", "15",
+                                   "16", "17", "18", "19"])
+
+    def test_large_output(self):
+        script = ("head -c 300000 /dev/zero; head -c 300000 /dev/zero >&2; "
+                  "head -c 300000 /dev/zero")
+        p = sh.sh(["-c", script])
+        self.assertEqual(p.retcode, 0)
+        self.assertEqual(len(p.stderr), 300000)
+        stats = p.iostats
+        self.assertEqual(stats['stdout'], 600000)
+        self.assertEqual(stats['stderr'], 300000)
+        self.assert_(stats['throughput'] > 0)
+
+    def test_large_stderr_while_streaming(self):
+        script = "head -c 300000 /dev/zero >&2; seq 3"
+        p = sh.sh(["-c", script])
+        self.assertEqual(list(p), ["1", "2", "3"])
+        self.assertEqual(len(p.stderr), 300000)
+
+    def test_thread_pump(self):
+        from cliutils.process import _threadPump
+        p = sh.sh(["-c", "seq 5000; seq 5000 >&2"])
+        p._spawn()
+        streams = {'out':p._process.stdout, 'err':p._process.stderr}
+        data = {'out':'', 'err':''}
+        for name, chunk in _threadPump(streams, 1024, {}):
+            data[name] += chunk
+        self.assertEqual(data['out'], data['err'])
+        self.assertEqual(data['out'].split()[-1], "5000")
+
+    def test_lazy(self):
+        p = sh.echo("blah")
+        self.assertEqual(p._process, None)
+        p | sh.cat()
+        self.assertEqual(p._process, None)
+
+    def test_single_spawn(self):
+        spawned = []
+        realPopen = process.Popen
+        def Popen(cmd, **kwargs):
+            spawned.append(cmd[0])
+            return realPopen(cmd, **kwargs)
+        process.Popen = Popen
+        try:
+            p = sh.echo("a b c") | sh.cat() | sh.wc("-w")
+            self.assertEqual(p.stdout, "3")
+        finally:
+            process.Popen = realPopen
+        self.assertEqual(spawned, ["echo", "cat", "wc"])
+
+    def test_pipe_grouping(self):
+        p = sh.echo("a b c") | (sh.cat() | sh.wc("-w"))
+        self.assertEqual(p.stdout, "3")
+
+    def test_pipe_upstream_results(self):
+        first = sh.sh(["-c", "echo oops >&2; echo a b; exit 3"])
+        p = first | sh.wc("-w")
+        self.assertEqual(first.retcode, 3)
+        self.assertEqual(first.stderr, "oops")
+        self.assertEqual(p.stdout, "2")
+        self.assertEqual(p.retcode, 0)
+
+    def test_pipe_read_upstream(self):
+        a = sh.seq("3")
+        b = a | sh.cat()
+        self.assertRaises(AlreadyExecuted, list, a)
+        self.assertRaises(AlreadyExecuted, a.readinto, bytearray(4))
+        self.assertEqual(b.stdout, "1\n2\n3")
+
+    def test_pipe_started(self):
+        p = sh.echo("blah")
+        p.stdout
+        self.assertRaises(AlreadyExecuted, lambda: p | sh.cat())
+
+    def test_run_many(self):
+        cmds = [sh.echo(str(i)) for i in range(20)] + ["notacommand", "false"]
+        results = run_many(cmds, max_workers=4)
+        self.assertEqual([p.stdout for p in results[:20]],
+                         map(str, range(20)))
+        self.assert_(isinstance(results[20], InvalidCommand))
+        self.assertEqual(results[21].retcode, 1)
+
+    def test_as_completed(self):
+        cmds = [sh.sleep("0.3"), sh.echo("fast")]
+        order = [i for i, p in as_completed(cmds, max_workers=2)]
+        self.assertEqual(order, [1, 0])
+        cmds = [sh.sleep("0.3"), sh.echo("fast")]
+        order = [i for i, p in as_completed(cmds, max_workers=1)]
+        self.assertEqual(order, [0, 1])
+
+    def test_as_completed_break(self):
+        directory = tempfile.mkdtemp()
+        try:
+            procs = [sh.sh(["-c", 'sleep 0.1; touch "$0"',
+                            os.path.join(directory, str(i))])
+                     for i in range(20)]
+            for index, p in as_completed(procs, 2):
+                break
+            self.assert_(len(os.listdir(directory)) <= 3)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_as_completed_break_kills(self):
+        slow = sh.sleep("10")
+        start = time.time()
+        for index, p in as_completed([slow, sh.true()], 2):
+            break
+        self.assertEqual(index, 1)
+        self.assert_(time.time() - start < 5)
+        self.assert_(slow._process.returncode is not None)
+
+    def test_binary(self):
+        data = " \x00\xffspam\n\t"
+        p = sh.printf(["%b", " \\0000\\0377spam\\n\t"])
+        self.assertEqual(p.stdout_bytes, data)
+        self.assertEqual(p.stdout, data.strip())
+        p = sh.printf(["%b", " \\0000\\0377spam\\n\t"], strip=False)
+        self.assertEqual(p.stdout, data)
+
+    def test_readinto(self):
+        p = sh.seq("1000")
+        expected = "\n".join(map(str, range(1, 1001))) + "\n"
+        buf = bytearray(1000)
+        received = []
+        while True:
+            n = p.readinto(buf)
+            received.append(str(buf[:n]))
+            if n < len(buf):
+                break
+        self.assertEqual("".join(received), expected)
+        self.assertEqual(p.readinto(buf), 0)
+        self.assertEqual(p.retcode, 0)
+
+    def test_readinto_executed(self):
+        p = sh.echo("spam")
+        p.stdout
+        buf = bytearray(10)
+        self.assertEqual(p.readinto(memoryview(buf)[2:]), 5)
+        self.assertEqual(buf[2:7], "spam\n")
+
+    def test_stdin_string(self):
+        p = sh.cat(stdin="spam and eggs")
+        self.assertEqual(p.stdout, "spam and eggs")
+        p = sh.cat(stdin=u"caf\xe9")
+        self.assertEqual(p.stdout, "caf\xc3\xa9")
+
+    def test_stdin_generator(self):
+        data = ("%d\n" % i for i in range(200000, 0, -1))
+        p = sh.sort(["-n"], stdin=data) | sh.tail(["-n", "1"])
+        self.assertEqual(p.stdout, "200000")
+
+    def test_stdin_concurrent_output(self):
+        # Both directions far exceed the pipe buffer.
+        data = ["x" * 65536] * 32
+        p = sh.cat(stdin=data)
+        self.assertEqual(len(p.stdout), 65536 * 32)
+
+    def test_stdin_piped(self):
+        self.assertRaises(ValueError, lambda: sh.echo("a") | sh.cat(stdin="x"))
+        self.assertRaises(ValueError,
+                          lambda: sh.echo("a") | sh.cat(stdin=iter(["x"])))
+        p = sh.echo("a")
+        self.assertRaises(ValueError, lambda: p | sh.cat(stdin=open(__file__)))
+        self.assertEqual((p | sh.cat()).stdout, "a")
+
+    def test_stdin_unread(self):
+        p = sh.true(stdin=["x" * 65536] * 32)
+        self.assertEqual(p.retcode, 0)
+
+    def test_stdin_thread_pump(self):
+        from cliutils.process import _threadPump
+        p = sh.cat(stdin="")
+        p._spawn()
+        feeds = {p._process.stdin: iter(["spam ", "eggs"])}
+        streams = {'out':p._process.stdout}
+        chunks = [c for n, c in _threadPump(streams, 1024, feeds)]
+        self.assertEqual("".join(chunks), "spam eggs")
+
+    def test_shell_cache(self):
+        d = tempfile.mkdtemp()
+        script = os.path.join(d, "cliutilsprobe")
+        f = open(script, 'w')
+        f.write("#!/bin/sh\necho probed\n")
+        f.close()
+        os.chmod(script, 0755)
+        path = os.environ['PATH']
+        try:
+            self.assertRaises(InvalidCommand, sh.cliutilsprobe)
+            os.environ['PATH'] = os.pathsep.join([path, d])
+            self.assert_(sh.cliutilsprobe is sh.cliutilsprobe)
+            p = sh.cliutilsprobe()
+            self.assertEqual(p._executable, script)
+            self.assertEqual(p.stdout, "probed")
+            os.environ['PATH'] = path
+            self.assertRaises(InvalidCommand, sh.cliutilsprobe)
+        finally:
+            os.environ['PATH'] = path
+            shutil.rmtree(d)
+
+    def test_shell_relative_path(self):
+        d = tempfile.mkdtemp()
+        script = os.path.join(d, "cliutilsrelprobe")
+        f = open(script, 'w')
+        f.write("#!/bin/sh\necho probed\n")
+        f.close()
+        os.chmod(script, 0755)
+        path, cwd = os.environ['PATH'], os.getcwd()
+        try:
+            os.chdir(d)
+            os.environ['PATH'] = os.pathsep.join([path, "."])
+            factory = sh.cliutilsrelprobe
+            self.assertEqual(process._which("cliutilsrelprobe",
+                                            os.environ['PATH']),
+                             os.path.join(os.getcwd(), "cliutilsrelprobe"))
+            os.chdir(cwd)
+            self.assertEqual(factory().stdout, "probed")
+        finally:
+            os.chdir(cwd)
+            os.environ['PATH'] = path
+            shutil.rmtree(d)
+
+    @unittest.skipIf(process._posixSpawn() is None, "posix_spawn unavailable")
+    def test_fastspawn(self):
+        p = sh.echo("blah blah", fastspawn=True)
+        self.assertEqual(p.stdout, "blah blah")
+        self.assert_(isinstance(p._process, process._SpawnedProcess))
+        first = sh.yes(fastspawn=True)
+        p = first | sh.head("-1", fastspawn=True)
+        self.assertEqual(p.stdout, "y")
+        self.assertEqual(first.retcode, -13)
+        p = sh.cat(stdin="spam", fastspawn=True)
+        self.assertEqual(p.stdout, "spam")
+        if os.path.isdir("/proc/self/fd"):
+            p = Process("ls /proc/self/fd", fastspawn=True)
+            self.assertEqual(p.stdout.split(), ["0", "1", "2", "3"])
+        p = Process("notacommand", fastspawn=True)
+        self.assertRaises(InvalidCommand, lambda: p.stdout)
+
+    def test_concurrent_spawn(self):
+        # A pipe made for one process mustn't leak into another spawned at the
+        # same time, or its reader waits for that one to exit too.
+        for fastspawn in (False, True):
+            procs = [sh.sleep("2", fastspawn=fastspawn) if i % 4 == 0
+                     else sh.echo("x", fastspawn=fastspawn)
+                     for i in range(200)]
+            start = time.time()
+            for index, p in as_completed(procs, 64):
+                if index % 4:
+                    self.assert_(time.time() - start < 1.5)
+
+    def _alive(self, pid):
+        try:
+            stat = open("/proc/%d/stat" % pid).read()
+        except IOError:
+            return False
+        return stat.split(")")[-1].split()[0] != "Z"
+
+    def test_timeout(self):
+        start = time.time()
+        p = sh.sh(["-c", "echo partial; echo oops >&2; sleep 10"], timeout=0.3)
+        try:
+            p.stdout
+        except Timeout, e:
+            self.assertEqual(e.stdout, "partial\n")
+            self.assertEqual(e.stderr, "oops\n")
+        else:
+            self.fail("Timeout not raised")
+        self.assert_(time.time() - start < 2)
+        self.assertEqual(p.retcode, -15)
+
+    def test_timeout_not_reached(self):
+        p = sh.echo("quick", timeout=5)
+        self.assertEqual(p.stdout, "quick")
+
+    def test_timeout_pipeline(self):
+        first = sh.sleep("10")
+        p = first | sh.cat(timeout=0.2)
+        self.assertRaises(Timeout, lambda: p.stdout)
+        self.assertNotEqual(first.retcode, 0)
+
+    @unittest.skipIf(not os.path.isdir("/proc/self"), "needs /proc")
+    def test_timeout_kills_group(self):
+        p = sh.sh(["-c", "sleep 30 & echo $!; wait"], timeout=0.3)
+        try:
+            p.stdout
+        except Timeout, e:
+            grandchild = int(e.stdout)
+        self.assertFalse(self._alive(grandchild))
+
+    def test_timeout_escalates(self):
+        p = sh.sh(["-c", "trap '' TERM; sleep 10"], timeout=0.1)
+        p.killgrace = 0.2
+        self.assertRaises(Timeout, lambda: p.retcode)
+        self.assertEqual(p.retcode, -9)
+
+    @unittest.skipIf(not os.path.isdir("/proc/self"), "needs /proc")
+    def test_abandoned_cleanup(self):
+        p = sh.sh(["-c", "echo started; sleep 30"])
+        self.assertEqual(p.iter_lines().next(), "started")
+        pid = p._process.pid
+        del p
+        self.assertFalse(self._alive(pid))
+
+    def test_metrics(self):
+        p = sh.sh(["-c", "echo spam; echo eggs >&2"])
+        self.assertEqual(p.metrics['pid'], None)
+        p.stdout
+        metrics = p.metrics
+        self.assertEqual(metrics['command'], "sh -c echo spam; echo eggs >&2")
+        self.assertEqual(metrics['retcode'], 0)
+        self.assertEqual((metrics['stdout'], metrics['stderr']), (5, 5))
+        self.assert_(0 < metrics['spawn'] <= metrics['wall'])
+        self.assert_(metrics['utime'] >= 0 and metrics['stime'] >= 0)
+        self.assert_(metrics['maxrss'] > 0)
+        self.assertFalse(metrics['cached'])
+
+    def test_hooks(self):
+        events = []
+        hooks = [(event, lambda p, event=event: events.append((event, p)))
+                 for event in ('spawn', 'exit', 'pipeline')]
+        for hook in hooks:
+            process.add_hook(*hook)
+        try:
+            first = sh.echo("a")
+            p = first | sh.cat()
+            p.stdout
+        finally:
+            for hook in hooks:
+                process.remove_hook(*hook)
+        sh.true().retcode
+        self.assertEqual(events, [('spawn', first), ('spawn', p),
+                                  ('exit', first), ('exit', p),
+                                  ('pipeline', p)])
+
+    def test_strip_whitespace_only(self):
+        self.assertEqual(sh.echo([""]).stdout, "")
+        self.assertEqual(Process(["printf", "  \n\n"]).stdout, "")
+        self.assertEqual(sh.sh(["-c", "echo >&2"]).stderr, "")
+        self.assertEqual(sh.echo([""], strip=False).stdout, "\n")
+
+    def test_pyfilter(self):
+        def upper(lines):
+            for line in lines:
+                yield line.upper()
+        p = sh.printf(["a\\nb\\n"]) | process.pyfilter(upper) | sh.cat()
+        self.assertEqual(p.stdout, "A\nB")
+        self.assertEqual(p.retcode, 0)
+
+    def test_pyfilter_ends(self):
+        def count(chunks):
+            yield str(sum(len(chunk) for chunk in chunks))
+        p = process.pyfilter(count, lines=False, stdin="spam")
+        self.assertEqual(p.stdout, "4")
+        self.assertEqual(p.pid, None)
+        p = sh.head(["-c", "1000000", "/dev/zero"]) | \
+            process.pyfilter(count, lines=False)
+        self.assertEqual(p.stdout, "1000000")
+
+    def test_pyfilter_streams(self):
+        def first(lines):
+            for line in lines:
+                yield line
+                break
+        p = sh.yes() | process.pyfilter(first)
+        self.assertEqual(p.stdout, "y")
+
+    def test_pyfilter_error(self):
+        def fail(lines):
+            raise ValueError("bad input")
+            yield
+        p = sh.echo("a") | process.pyfilter(fail) | sh.cat()
+        self.assertEqual(p.stdout, "")
+        self.assertEqual(p._upstream.retcode, 1)
+        self.assert_("ValueError: bad input" in p._upstream.stderr)
+
+    def test_pyfilter_timeout(self):
+        def slow(lines):
+            time.sleep(10)
+            return lines
+        p = sh.seq("3") | process.pyfilter(slow) | sh.cat(timeout=0.3)
+        start = time.time()
+        self.assertRaises(Timeout, lambda: p.stdout)
+        self.assert_(time.time() - start < 3)
+        self.assertEqual(p._upstream.retcode, -9)
+
+    def test_spill(self):
+        p = sh.printf(["  spam\\n  "], spill=4)
+        self.assertEqual(p.stdout_bytes[:], "  spam\n  ")
+        self.assert_(isinstance(p.stdout, buffer))
+        self.assertEqual(str(p.stdout), "spam")
+        buf = bytearray(4)
+        self.assertEqual((p.readinto(buf), buf), (4, bytearray("  sp")))
+        p = sh.printf(["spam"], spill=4)
+        self.assertEqual(p.stdout, "spam")
+
+    def test_spill_print(self):
+        p = sh.seq("100000", spill=1024)
+        self.assertEqual(str(p).split("\n")[-1], "100000")
+        self.assertEqual(repr(p), str(p))
+        p = sh.seq("3", spill=2, strip=False)
+        self.assertEqual(str(p), "1\n2\n3\n")
+
+    def test_spill_large(self):
+        p = Process(["head", "-c", str(4 * 1024 * 1024), "/dev/zero"],
+                    spill=65536)
+        out = p.stdout_bytes
+        self.assertEqual(len(out), 4 * 1024 * 1024)
+        self.assertEqual(out.find("\x01"), -1)
+        self.assertEqual(p._stdoutstorage._chunks, [])
+
+    def test_spill_stderr(self):
+        p = sh.sh(["-c", "echo spam >&2"], spill=1)
+        self.assertEqual(str(p.stderr), "spam")
+
 
 if __name__=="__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+import os
+import tempfile
+
+from cliutils.process import run_many
+from cliutils.session import Session, SessionPool, SessionError
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.session = Session()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_getOutput(self):
+        r = self.session.echo("blah blah")
+        self.assertEqual(r.stdout, "blah blah")
+        self.assertEqual(r.stderr, "")
+        self.assertEqual(r.retcode, 0)
+
+    def test_lazy(self):
+        r = self.session.echo("blah")
+        self.assertEqual(self.session._process, None)
+        r.stdout
+        self.assertNotEqual(self.session._process, None)
+
+    def test_one_shell(self):
+        pids = [self.session.sh(["-c", "echo $PPID"]).stdout
+                for i in range(3)]
+        self.assertEqual(len(set(pids)), 1)
+
+    def test_stderr_retcode(self):
+        r = self.session.sh(["-c", "echo out; echo err >&2; exit 42"])
+        self.assertEqual((r.stdout, r.stderr, r.retcode), ("out", "err", 42))
+
+    def test_framing(self):
+        r = self.session.printf(["no newline"])
+        self.assertEqual(r.stdout, "no newline")
+        r = self.session.printf(["a\\n\\n"], strip=False)
+        self.assertEqual(r.stdout, "a\n\n")
+        r = self.session.head(["-c", "300000", "/dev/zero"])
+        self.assertEqual(len(r.stdout), 300000)
+
+    def test_quoting(self):
+        r = self.session.echo(["$HOME", "a;b", "'q'"])
+        self.assertEqual(r.stdout, "$HOME a;b 'q'")
+
+    def test_no_input(self):
+        self.assertEqual(self.session.cat().stdout, "")
+        self.assertEqual(self.session.echo("after").stdout, "after")
+
+    def test_missing(self):
+        self.assertEqual(self.session.notacommand().retcode, 127)
+
+    def test_state(self):
+        d = os.path.realpath(tempfile.mkdtemp())
+        self.session.run(["cd", d]).retcode
+        self.assertEqual(self.session.pwd().stdout, d)
+        os.rmdir(d)
+
+    def test_strip_whitespace_only(self):
+        self.assertEqual(self.session.echo([""]).stdout, "")
+        result = self.session.sh(["-c", "echo >&2"])
+        self.assertEqual(result.stderr, "")
+        self.assertEqual(self.session.run(["echo", ""], strip=False).stdout,
+                         "\n")
+
+    def test_exit(self):
+        result = self.session.run("exit")
+        self.assertRaises(SessionError, lambda: result.stdout)
+        self.assertEqual(self.session.echo("again").stdout, "again")
+
+
+class TestSessionPool(unittest.TestCase):
+
+    def test_pool(self):
+        pool = SessionPool(3)
+        try:
+            results = run_many([pool.sh(["-c", "sleep 0.1; echo $PPID"])
+                                for i in range(6)], max_workers=3)
+            self.assertEqual(len(set(r.stdout for r in results)), 3)
+            self.assertEqual([r.retcode for r in results], [0] * 6)
+        finally:
+            pool.close()
+
+
+if __name__=="__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+import json
+from StringIO import StringIO
+
+from cliutils.cache import ResultCache
+from cliutils.process import sh
+from cliutils.stats import ProcessStats
+
+class TestProcessStats(unittest.TestCase):
+
+    def test_report(self):
+        stats = ProcessStats().install()
+        try:
+            for i in range(3):
+                (sh.seq("100") | sh.wc("-l")).stdout
+            sh.false().retcode
+        finally:
+            stats.uninstall()
+        sh.true().retcode
+        report = stats.report()
+        self.assertEqual(sorted(report), ['false', 'seq', 'wc'])
+        self.assertEqual(report['seq']['count'], 3)
+        self.assertEqual(report['seq']['stdout'], 0)
+        self.assertEqual(report['wc']['stdout'], 3 * 4)
+        self.assertEqual(report['false']['failures'], 1)
+        self.assert_(report['wc']['wall'] > 0)
+        self.assert_(report['wc']['mean_wall'] <= report['wc']['wall'])
+        self.assert_(report['wc']['maxrss'] > 0)
+
+    def test_cached(self):
+        cache = ResultCache()
+        stats = ProcessStats().install()
+        try:
+            sh.echo("a", cache=cache).stdout
+            sh.echo("a", cache=cache).stdout
+        finally:
+            stats.uninstall()
+        self.assertEqual(stats.report()['echo']['count'], 2)
+        self.assertEqual(stats.report()['echo']['cached'], 1)
+
+    def test_dump(self):
+        stats = ProcessStats().install()
+        try:
+            sh.true().retcode
+        finally:
+            stats.uninstall()
+        f = StringIO()
+        stats.dump(f)
+        self.assertEqual(json.loads(f.getvalue())['true']['count'], 1)
+        stats.reset()
+        self.assertEqual(stats.report(), {})
+
+
+if __name__=="__main__":
+    unittest.main()
@@ -32,5 +32,6 @@ setup(name='cliutils',
       include_package_data=True,
       zip_safe=True,
       install_requires=[],
+      extras_require={'async': ['trollius']},
       entry_points="",
       )